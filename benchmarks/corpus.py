@@ -0,0 +1,225 @@
+"""
+Synthetic, labelled barcode photos for the decode benchmark.
+
+Symbols are rendered from scratch (EAN-13 and Code 128 here, QR through
+OpenCV's encoder), placed on a label-like background at phone camera
+resolutions and degraded with skew, blur, glare, noise and JPEG artifacts.
+The same seed always produces the same corpus.
+"""
+import json
+import os
+import sys
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.bom import PROJECT_ROOT
+
+MANIFEST = "manifest.json"
+# (width, height) of the phone / webcam photos we get from the packing floor
+RESOLUTIONS = ((1280, 720), (1920, 1080), (3024, 4032))
+# The real photo shipped with the repo, with its known content
+REAL_SAMPLES = (("Img.jpg", "EAN13", "8909106007314"),)
+
+# One corpus entry; params records how the image was degraded.
+Sample = namedtuple("Sample", ["file", "symbology", "text", "params"])
+
+_EAN_L = ("0001101", "0011001", "0010011", "0111101", "0100011",
+          "0110001", "0101111", "0111011", "0110111", "0001011")
+_EAN_G = tuple(code[::-1].translate(str.maketrans("01", "10")) for code in _EAN_L)
+_EAN_R = tuple(code.translate(str.maketrans("01", "10")) for code in _EAN_L)
+_EAN_PARITY = ("LLLLLL", "LLGLGG", "LLGGLG", "LLGGGL", "LGLLGG",
+               "LGGLLG", "LGGGLL", "LGLGLG", "LGLGGL", "LGGLGL")
+
+# Code 128 bar/space widths for symbol values 0..105, then the stop pattern
+_C128 = (
+    "212222 222122 222221 121223 121322 131222 122213 122312 132212 221213 "
+    "221312 231212 112232 122132 122231 113222 123122 123221 223211 221132 "
+    "221231 213212 223112 312131 311222 321122 321221 312212 322112 322211 "
+    "212123 212321 232121 111323 131123 131321 112313 132113 132311 211313 "
+    "231113 231311 112133 112331 132131 113123 113321 133121 313121 211331 "
+    "231131 213113 213311 213131 311123 311321 331121 312113 312311 332111 "
+    "314111 221411 431111 111224 111422 121124 121421 141122 141221 112214 "
+    "112412 122114 122411 142112 142211 241211 221114 413111 241112 134111 "
+    "111242 121142 121241 114212 124112 124211 411212 421112 421211 212141 "
+    "214121 412121 111143 111341 131141 114113 114311 411113 411311 113141 "
+    "114131 311141 411131 211412 211214 211232"
+).split()
+_C128_STOP = "2331112"
+_C128_START_B = 104
+
+
+def ean13_check_digit(digits12):
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(reversed(digits12), start=1))
+    return str((10 - total % 10) % 10)
+
+
+def ean13_modules(code):
+    """The 95 modules of an EAN-13 symbol as a '0'/'1' string."""
+    parity = _EAN_PARITY[int(code[0])]
+    left = "".join((_EAN_L if p == "L" else _EAN_G)[int(d)] for p, d in zip(parity, code[1:7]))
+    right = "".join(_EAN_R[int(d)] for d in code[7:])
+    return "101" + left + "01010" + right + "101"
+
+
+def code128_modules(text):
+    """Code set B modules for printable ASCII text, checksum included."""
+    values = [_C128_START_B] + [ord(c) - 32 for c in text]
+    checksum = sum(v * (i or 1) for i, v in enumerate(values)) % 103
+    modules = []
+    for width_pattern in [_C128[v] for v in values + [checksum]] + [_C128_STOP]:
+        for i, width in enumerate(width_pattern):
+            modules.append(("1" if i % 2 == 0 else "0") * int(width))
+    return "".join(modules)
+
+
+def render_linear(modules, module_px, height_px, quiet=10):
+    """Black-on-white 1D symbol with a quiet zone of `quiet` modules each side."""
+    row = np.array([0 if m == "1" else 255 for m in "0" * quiet + modules + "0" * quiet], dtype=np.uint8)
+    return np.tile(np.repeat(row, module_px), (height_px, 1))
+
+
+def render_qr(text, module_px):
+    encoder = cv2.QRCodeEncoder.create()
+    return cv2.resize(encoder.encode(text), (0, 0), fx=module_px, fy=module_px, interpolation=cv2.INTER_NEAREST)
+
+
+def render_symbol(symbology, text, module_px):
+    if symbology == "EAN13":
+        return render_linear(ean13_modules(text), module_px, module_px * 60)
+    if symbology == "CODE128":
+        return render_linear(code128_modules(text), module_px, module_px * 40)
+    if symbology == "QRCODE":
+        return render_qr(text, module_px)
+    raise ValueError(f"Unknown symbology: {symbology}")
+
+
+def random_text(rng, symbology):
+    if symbology == "EAN13":
+        digits = "890" + "".join(str(d) for d in rng.integers(0, 10, 9))
+        return digits + ean13_check_digit(digits)
+    if symbology == "CODE128":
+        return "100" + "".join(str(d) for d in rng.integers(0, 10, 7))
+    return f"HDR-1001009100-{int(rng.integers(1, 10000)):04d}"
+
+
+def _background(rng, width, height):
+    """Off-white label stock with faint print clutter."""
+    base = rng.integers(200, 245)
+    canvas = np.full((height, width), base, dtype=np.uint8)
+    for _ in range(int(rng.integers(5, 15))):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        scale = width / 1280.0
+        cv2.putText(canvas, "LOT 03/25 PR-05-000", (x, y), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.8 * scale, int(rng.integers(40, 120)), max(1, int(2 * scale)))
+    return canvas
+
+
+def _place(rng, canvas, symbol, fill):
+    """Scale the symbol to `fill` of the canvas width and paste it with a random skew."""
+    height, width = canvas.shape
+    scale = fill * min(width, height) / float(max(symbol.shape))
+    symbol = cv2.resize(symbol, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    sh, sw = symbol.shape
+    x0 = int(rng.integers(0, max(1, width - sw)))
+    y0 = int(rng.integers(0, max(1, height - sh)))
+    src = np.float32([[0, 0], [sw, 0], [sw, sh], [0, sh]])
+    jitter = rng.uniform(-0.08, 0.08, size=(4, 2)) * [sw, sh]
+    dst = np.float32(src + [x0, y0] + jitter)
+    matrix = cv2.getPerspectiveTransform(src, dst)
+    mask = cv2.warpPerspective(np.full_like(symbol, 255), matrix, (width, height))
+    warped = cv2.warpPerspective(symbol, matrix, (width, height), borderValue=255)
+    # Ink darkens the paper, it does not replace it
+    darker = np.minimum(canvas, warped)
+    return np.where(mask > 0, darker, canvas), float(np.abs(jitter).max() / max(sw, sh))
+
+
+def _glare(rng, image, strength):
+    height, width = image.shape
+    cx, cy = rng.uniform(0, width), rng.uniform(0, height)
+    radius = rng.uniform(0.1, 0.3) * max(width, height)
+    yy, xx = np.ogrid[:height, :width]
+    spot = np.exp(-((xx - cx) ** 2 + (yy - cy) ** 2) / (2 * radius ** 2))
+    return np.clip(image + strength * 255 * spot, 0, 255).astype(np.uint8)
+
+
+def degrade(rng, image):
+    """Apply blur, glare and sensor noise; returns (image, params)."""
+    params = {}
+    blur = float(rng.choice([0, 0, 0.8, 1.5, 2.5]))
+    if blur:
+        image = cv2.GaussianBlur(image, (0, 0), blur * image.shape[1] / 1280.0)
+    params["blur_sigma"] = blur
+    glare = float(rng.choice([0, 0, 0.3, 0.6]))
+    if glare:
+        image = _glare(rng, image.astype(np.float32), glare)
+    params["glare"] = glare
+    noise = float(rng.uniform(0, 8))
+    image = np.clip(image + rng.normal(0, noise, image.shape), 0, 255).astype(np.uint8)
+    params["noise_sigma"] = round(noise, 2)
+    return image, params
+
+
+def make_sample(rng, symbology, resolution):
+    """Render one degraded photo; returns (BGR image, text, params)."""
+    text = random_text(rng, symbology)
+    module_px = 4
+    width, height = resolution
+    canvas = _background(rng, width, height)
+    fill = float(rng.uniform(0.25, 0.6))
+    image, skew = _place(rng, canvas, render_symbol(symbology, text, module_px), fill)
+    image, params = degrade(rng, image)
+    params.update({"resolution": [width, height], "fill": round(fill, 3), "skew": round(skew, 3)})
+    return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR), text, params
+
+
+def build_corpus(out_dir, per_symbology=20, seed=0, symbologies=("EAN13", "CODE128", "QRCODE")):
+    """Write the corpus JPEGs and manifest.json into out_dir; returns the samples."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    samples = []
+    for symbology in symbologies:
+        for n in range(per_symbology):
+            resolution = RESOLUTIONS[n % len(RESOLUTIONS)]
+            image, text, params = make_sample(rng, symbology, resolution)
+            quality = int(rng.integers(40, 95))
+            params["jpeg_quality"] = quality
+            name = f"{symbology.lower()}_{n:03d}.jpg"
+            cv2.imwrite(os.path.join(out_dir, name), image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            samples.append(Sample(name, symbology, text, params))
+
+    with open(os.path.join(out_dir, MANIFEST), "w") as f:
+        json.dump({"seed": seed, "samples": [s._asdict() for s in samples]}, f, indent=1)
+    return samples
+
+
+def load_corpus(out_dir, include_real=True):
+    """Samples as (path, Sample) pairs, plus the real photos shipped with the repo."""
+    with open(os.path.join(out_dir, MANIFEST)) as f:
+        samples = [Sample(**s) for s in json.load(f)["samples"]]
+    entries = [(os.path.join(out_dir, s.file), s) for s in samples]
+    if include_real:
+        for name, symbology, text in REAL_SAMPLES:
+            path = os.path.join(PROJECT_ROOT, name)
+            if os.path.exists(path):
+                entries.append((path, Sample(name, symbology, text, {"real": True})))
+    return entries
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate the synthetic barcode corpus")
+    parser.add_argument("out", help="corpus directory")
+    parser.add_argument("--per-symbology", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    samples = build_corpus(args.out, args.per_symbology, args.seed)
+    print(f"Wrote {len(samples)} images to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Load generator for the packing database: N concurrent packing sessions.
+
+    python -m benchmarks.db_load --manager db_manager1 --sessions 16 --duration 30
+
+Each session loops for the given duration, saving slips through the
+manager's save_packing_slip (random item counts, optional photo payloads)
+and, with probability --read-ratio, streaming a CSV export instead.
+Sessions are threads sharing one process, as Streamlit sessions do;
+--processes runs several such processes against the same file, like
+several app servers.
+
+The manager is pointed at a scratch database through PACKING_DB /
+PACKING1_DB, never at the real one. Reported: commits/sec, save and
+export latency percentiles, connection-pool wait, SQLite lock wait,
+"database is locked" errors and database/image growth.
+"""
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# manager module -> environment variables for its (db file, image directory)
+MANAGERS = {
+    "db_manager": ("PACKING_DB", "PACKING_IMAGE_DIR"),
+    "db_manager1": ("PACKING1_DB", "PACKING1_IMAGE_DIR"),
+}
+# Sequential saves used to measure uncontended latency before the load starts
+CALIBRATION_SAVES = 30
+
+
+def _use_scratch(manager, workdir):
+    db_var, image_var = MANAGERS[manager]
+    os.environ[db_var] = os.path.join(workdir, "load.db")
+    os.environ[image_var] = os.path.join(workdir, "images")
+
+
+def _import_manager(manager, workdir):
+    import importlib
+
+    _use_scratch(manager, workdir)
+    return importlib.import_module(f"database.{manager}")
+
+
+def make_slip(rng, items_mean, image_kb):
+    """A random slip: unique header, Poisson item count, optional photo per item."""
+    header_id = f"HDR-{uuid.uuid4().hex[:16]}"
+    header_info = {
+        "header_id": header_id,
+        "customer_name": rng.choice(("Acme", "Globex", "Initech", "Umbrella", "Hooli")),
+        "location": rng.choice(("Dock 1", "Dock 2", "Yard")),
+        "time_of_packing": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    count = max(1, int(np.random.default_rng(rng.randrange(2 ** 32)).poisson(items_mean)))
+    items = [{
+        # Unique per slip, as db_manager1's UNIQUE (header_id, item_id) expects
+        "item_id": f"100{rng.randrange(10 ** 7):07d}-{n}",
+        "description": "Synthetic item",
+        "quantity": rng.randint(1, 5),
+        "image": os.urandom(image_kb * 1024) if image_kb else None,
+    } for n in range(count)]
+    return header_info, items
+
+
+def _timed_checkouts(pool, waits):
+    """Record how long each pool checkout waits for a free connection."""
+    checkout = pool._checkout
+
+    def timed(timeout):
+        started = time.perf_counter()
+        try:
+            return checkout(timeout)
+        finally:
+            waits.append(time.perf_counter() - started)
+
+    pool._checkout = timed
+
+
+class _Discard:
+    """Write-only, unseekable sink: the export is streamed and thrown away."""
+
+    def write(self, data):
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def _session(manager, stop_at, seed, opts, out):
+    from database.export import ExportFilter, export_zip
+
+    rng = random.Random(seed)
+    today = time.strftime("%Y-%m-%d")
+    while time.perf_counter() < stop_at:
+        reading = rng.random() < opts["read_ratio"]
+        started = time.perf_counter()
+        try:
+            if reading:
+                export_zip(manager.pool, _Discard(), ExportFilter(start=today))
+            else:
+                header_info, items = make_slip(rng, opts["items_mean"], opts["image_kb"])
+                manager.save_packing_slip(header_info, items)
+        except sqlite3.OperationalError as e:
+            out["errors"].append(str(e))
+            continue
+        elapsed = time.perf_counter() - started
+        if reading:
+            out["export"].append(elapsed)
+        else:
+            out["save"].append(elapsed)
+            out["items"] += len(items)
+
+
+def run_process(manager, workdir, sessions, duration, seed, opts):
+    """One app-server process: `sessions` threads hammering the shared pool."""
+    module = _import_manager(manager, workdir)
+    out = {"save": [], "export": [], "errors": [], "items": 0, "pool_wait": []}
+    _timed_checkouts(module.pool, out["pool_wait"])
+    started = time.perf_counter()
+    stop_at = started + duration
+    threads = [
+        threading.Thread(target=_session, args=(module, stop_at, seed * 1000 + n, opts, out))
+        for n in range(sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    out["elapsed"] = time.perf_counter() - started
+    return out
+
+
+def _size(workdir):
+    total = 0
+    for folder, _, files in os.walk(workdir):
+        total += sum(os.path.getsize(os.path.join(folder, name)) for name in files)
+    return total
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+    return {"p50_ms": round(p50, 2), "p95_ms": round(p95, 2), "p99_ms": round(p99, 2), "count": len(values)}
+
+
+def run_load(manager="db_manager", sessions=8, processes=1, duration=10.0,
+             items_mean=12, image_kb=0, read_ratio=0.05, workdir=None, seed=0):
+    """Run the load test and return the results dict."""
+    workdir = workdir or tempfile.mkdtemp(prefix="packing-load-")
+    opts = {"items_mean": items_mean, "image_kb": image_kb, "read_ratio": read_ratio}
+
+    # Uncontended save latency; anything above it under load is waiting
+    module = _import_manager(manager, workdir)
+    rng = random.Random(seed)
+    calibration = []
+    for _ in range(CALIBRATION_SAVES):
+        header_info, items = make_slip(rng, items_mean, image_kb)
+        started = time.perf_counter()
+        module.save_packing_slip(header_info, items)
+        calibration.append(time.perf_counter() - started)
+    baseline = float(np.median(calibration))
+    size_before = _size(workdir)
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(processes, mp_context=context) as pool:
+        futures = [
+            pool.submit(run_process, manager, workdir, sessions, duration, seed + p + 1, opts)
+            for p in range(processes)
+        ]
+        outs = [f.result() for f in futures]
+    # Process start-up is not part of the load window
+    wall = max(out["elapsed"] for out in outs)
+
+    saves = [t for out in outs for t in out["save"]]
+    exports = [t for out in outs for t in out["export"]]
+    pool_waits = [t for out in outs for t in out["pool_wait"]]
+    errors = [e for out in outs for e in out["errors"]]
+    items = sum(out["items"] for out in outs)
+    size_after = _size(workdir)
+
+    with module.pool.connection() as conn:
+        slip_count = conn.execute("SELECT COUNT(*) FROM packing_slip").fetchone()[0]
+
+    return {
+        "manager": manager,
+        "sessions": sessions,
+        "processes": processes,
+        "duration_s": round(wall, 2),
+        "commits_per_s": round(len(saves) / wall, 1),
+        "items_per_s": round(items / wall, 1),
+        "save_latency": _percentiles(saves),
+        "export_latency": _percentiles(exports),
+        "uncontended_save_ms": round(baseline * 1000, 2),
+        # Time beyond the uncontended latency: waiting on SQLite's write lock
+        # (busy_timeout) or on other writers' fsyncs
+        "lock_wait_s": round(sum(max(0.0, t - baseline) for t in saves), 2),
+        "pool_wait_s": round(sum(pool_waits), 2),
+        "pool_wait_p99_ms": round(float(np.percentile(pool_waits, 99)) * 1000, 2) if pool_waits else None,
+        "locked_errors": sum("locked" in e for e in errors),
+        "other_errors": sorted(set(e for e in errors if "locked" not in e)),
+        "slips_total": slip_count,
+        "bytes_before": size_before,
+        "bytes_after": size_after,
+        "bytes_per_slip": round((size_after - size_before) / max(1, len(saves))),
+        "workdir": workdir,
+    }
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Concurrent packing-session load test")
+    parser.add_argument("--manager", choices=sorted(MANAGERS), default="db_manager")
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent sessions per process")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--items-mean", type=float, default=12)
+    parser.add_argument("--image-kb", type=int, default=0, help="photo payload per item; 0 for none")
+    parser.add_argument("--read-ratio", type=float, default=0.05, help="fraction of operations that export")
+    parser.add_argument("--workdir", help="scratch directory (default: a new temp dir)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    results = run_load(
+        args.manager, args.sessions, args.processes, args.duration,
+        args.items_mean, args.image_kb, args.read_ratio, args.workdir, args.seed,
+    )
+    print(json.dumps(results, indent=1))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
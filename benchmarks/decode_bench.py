@@ -0,0 +1,248 @@
+"""
+Decode benchmark: every decoder in the project against the labelled corpus.
+
+    python -m benchmarks.decode_bench /tmp/corpus --out results.json
+    python -m benchmarks.decode_bench /tmp/corpus --compare results.json
+
+Each decoder runs in its own fresh process so peak memory is its own.
+Latency is measured one image at a time, throughput with one worker per
+core. Decoders are called without the content-hash cache, otherwise
+repeats would measure dictionary lookups.
+"""
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.corpus import build_corpus, load_corpus, MANIFEST
+
+# name -> "module:factory"; the factory returns a bytes -> text|None callable
+DECODERS = {
+    "Scanner.decode_barcode_from_bytes": "benchmarks.decode_bench:_scanner",
+    "Scanner.decode_mobile_image": "benchmarks.decode_bench:_mobile",
+    "scanner1.decode_barcode_from_bytes": "benchmarks.decode_bench:_scanner1",
+    "EAN13Scanner.find_ean13": "benchmarks.decode_bench:_ean13_scanner",
+    "engine:opencv": "benchmarks.decode_bench:_engine_opencv",
+    "engine:pil": "benchmarks.decode_bench:_engine_pil",
+    "engine:ean13": "benchmarks.decode_bench:_engine_ean13",
+    "engine:adaptive": "benchmarks.decode_bench:_engine_adaptive",
+}
+# A p50 slower by more than this fraction, or any accuracy drop, is a regression
+LATENCY_TOLERANCE = 0.10
+
+Run = namedtuple("Run", ["latencies", "reads", "peak_rss_mb", "rss_growth_mb"])
+
+
+def _scanner():
+    from modules.Scanner import _decode_barcode
+    return _decode_barcode
+
+
+def _mobile():
+    from modules.Scanner import decode_mobile_image
+    return lambda image_bytes: decode_mobile_image(image_bytes, profile=None)
+
+
+def _scanner1():
+    from modules.scanner1 import _decode_barcode
+    return _decode_barcode
+
+
+def _ean13_scanner():
+    import cv2
+    scanner = importlib.import_module("modules.1").EAN13Scanner()
+
+    def run(image_bytes):
+        frame = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+        return scanner.find_ean13(frame)
+    return run
+
+
+def _engine(strategy):
+    from modules.engine import ScannerEngine
+    engine = ScannerEngine(strategy, stats_path=None)
+    return lambda image_bytes: engine.decode_result(image_bytes).data
+
+
+def _engine_opencv():
+    return _engine("opencv")
+
+
+def _engine_pil():
+    return _engine("pil")
+
+
+def _engine_ean13():
+    return _engine("ean13")
+
+
+def _engine_adaptive():
+    return _engine("adaptive")
+
+
+def load_decoder(name):
+    module, factory = DECODERS[name].split(":")
+    return getattr(importlib.import_module(module), factory)()
+
+
+def _rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _measure(name, paths, repeat):
+    """Runs in a fresh process: warm up, then time every image `repeat` times."""
+    decode = load_decoder(name)
+    images = []
+    for path in paths:
+        with open(path, "rb") as f:
+            images.append(f.read())
+    decode(images[0])
+    baseline = _rss_mb()
+
+    latencies = [[] for _ in images]
+    reads = [None] * len(images)
+    for _ in range(repeat):
+        for i, image_bytes in enumerate(images):
+            started = time.perf_counter()
+            reads[i] = decode(image_bytes)
+            latencies[i].append(time.perf_counter() - started)
+    peak = _rss_mb()
+    return Run(latencies, reads, round(peak, 1), round(peak - baseline, 1))
+
+
+_worker_decode = None
+
+
+def _init_worker(name):
+    global _worker_decode
+    _worker_decode = load_decoder(name)
+
+
+def _decode_path(path):
+    with open(path, "rb") as f:
+        return _worker_decode(f.read())
+
+
+def _throughput(context, name, paths, workers):
+    """Images per second per worker with one decoder process per core."""
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=(name,)) as pool:
+        # First map warms every worker (imports, OpenCV thread pools)
+        list(pool.map(_decode_path, paths[:workers]))
+        started = time.perf_counter()
+        list(pool.map(_decode_path, paths))
+        elapsed = time.perf_counter() - started
+    return len(paths) / elapsed / workers
+
+
+def _percentiles(values):
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+    return {"p50_ms": round(p50, 2), "p95_ms": round(p95, 2), "p99_ms": round(p99, 2)}
+
+
+def _accuracy(samples, reads):
+    """Per symbology: correct reads, misreads (wrong text) and misses."""
+    by_symbology = {}
+    for sample, read in zip(samples, reads):
+        stats = by_symbology.setdefault(sample.symbology, {"total": 0, "correct": 0, "misread": 0})
+        stats["total"] += 1
+        if read == sample.text:
+            stats["correct"] += 1
+        elif read is not None:
+            stats["misread"] += 1
+    for stats in by_symbology.values():
+        stats["accuracy"] = round(stats["correct"] / stats["total"], 3)
+    return by_symbology
+
+
+def benchmark(corpus_dir, decoders=tuple(DECODERS), repeat=3, workers=None):
+    """Run the decoders over the corpus; returns the results dict that is saved as JSON."""
+    entries = load_corpus(corpus_dir)
+    paths = [path for path, _ in entries]
+    samples = [sample for _, sample in entries]
+    workers = workers or os.cpu_count() or 1
+    context = multiprocessing.get_context("spawn")
+
+    results = {}
+    for name in decoders:
+        with ProcessPoolExecutor(1, mp_context=context) as pool:
+            run = pool.submit(_measure, name, paths, repeat).result()
+        per_image = [min(times) for times in run.latencies]
+        all_times = [t for times in run.latencies for t in times]
+        results[name] = {
+            "latency": _percentiles(all_times),
+            "per_image_ms": {s.file: round(t * 1000, 2) for s, t in zip(samples, per_image)},
+            "throughput_per_core": round(_throughput(context, name, paths, workers), 2),
+            "peak_rss_mb": run.peak_rss_mb,
+            "rss_growth_mb": run.rss_growth_mb,
+            "accuracy": _accuracy(samples, run.reads),
+        }
+        latency = results[name]["latency"]
+        print(f"{name}: p50 {latency['p50_ms']} ms, p99 {latency['p99_ms']} ms, "
+              f"{results[name]['throughput_per_core']} img/s/core, peak {run.peak_rss_mb} MB")
+
+    return {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "machine": {"python": platform.python_version(), "cpus": os.cpu_count(), "workers": workers},
+        "images": len(paths),
+        "repeat": repeat,
+        "decoders": results,
+    }
+
+
+def compare(baseline, current, tolerance=LATENCY_TOLERANCE):
+    """Return human-readable regressions of `current` against `baseline`."""
+    regressions = []
+    for name, now in current["decoders"].items():
+        before = baseline["decoders"].get(name)
+        if before is None:
+            continue
+        old, new = before["latency"]["p50_ms"], now["latency"]["p50_ms"]
+        if old and new > old * (1 + tolerance):
+            regressions.append(f"{name}: p50 {old} -> {new} ms")
+        for symbology, stats in now["accuracy"].items():
+            old_accuracy = before["accuracy"].get(symbology, {}).get("accuracy")
+            if old_accuracy is not None and stats["accuracy"] < old_accuracy:
+                regressions.append(f"{name}: {symbology} accuracy {old_accuracy} -> {stats['accuracy']}")
+    return regressions
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the barcode decoders")
+    parser.add_argument("corpus", help="corpus directory; generated if it has no manifest")
+    parser.add_argument("--decoder", action="append", choices=sorted(DECODERS), help="repeatable; default all")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline results JSON; exit 1 on regression")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(os.path.join(args.corpus, MANIFEST)):
+        build_corpus(args.corpus)
+    results = benchmark(args.corpus, args.decoder or tuple(DECODERS), args.repeat, args.workers)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=1)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
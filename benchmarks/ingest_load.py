@@ -0,0 +1,230 @@
+"""
+Load test for the ingest service (ingest.py).
+
+    python -m benchmarks.ingest_load --connections 64 --duration 20
+    python -m benchmarks.ingest_load --mode slips --items 12 --photo-ratio 0.25
+
+Starts the service on a scratch database in a subprocess, then drives it
+from keep-alive HTTP connections on one event loop until the duration
+is up. --mode scan posts labelled corpus photos to /scan (each made
+unique so the decode cache cannot answer unless --repeat), resized the
+way the capture component sends them (--max-side); --mode slips posts
+whole slips to /slips, items as decoded codes with a --photo-ratio share
+sent as photos to decode.
+
+Reported: images (or slips) per second, latency percentiles, status
+counts (503 is backpressure, not failure), read accuracy against the
+corpus labels and the slips actually committed.
+"""
+import asyncio
+import base64
+import json
+import os
+import random
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.corpus import build_corpus, load_corpus
+from benchmarks.db_load import MANAGERS, _percentiles
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP_TIMEOUT = 120
+# modules.capture's CAPTURE_MAX_SIDE default, without importing Streamlit
+MAX_SIDE = 1600
+
+
+def _shrink(path, max_side):
+    """JPEG bytes of a corpus photo resized as the browser would before upload."""
+    image = cv2.imread(path)
+    h, w = image.shape[:2]
+    scale = min(1.0, max_side / max(h, w))
+    if scale < 1.0:
+        image = cv2.resize(image, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+    return cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+
+
+def load_photos(corpus_dir, max_side):
+    """(jpeg bytes, expected text) for every corpus sample."""
+    if not os.path.exists(os.path.join(corpus_dir, "manifest.json")):
+        build_corpus(corpus_dir, per_symbology=10)
+    return [(_shrink(path, max_side), sample.text) for path, sample in load_corpus(corpus_dir)]
+
+
+async def _request(reader, writer, method, path, body=b"", content_type="application/octet-stream"):
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: ingest\r\nContent-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    payload = await reader.readexactly(length)
+    return status, json.loads(payload) if payload.startswith(b"{") else payload
+
+
+def _slip(rng, photos, items, photo_ratio):
+    slip_items = []
+    # Roughly Poisson item counts, as in db_load
+    for _ in range(max(1, round(rng.gauss(items, items ** 0.5)))):
+        if rng.random() < photo_ratio:
+            image, _ = rng.choice(photos)
+            slip_items.append({"image": base64.b64encode(image).decode()})
+        else:
+            slip_items.append({"item_id": f"{rng.randrange(10 ** 12):013d}", "quantity": rng.randint(1, 5)})
+    return {
+        "header_id": f"HDR-{uuid.uuid4().hex[:16]}",
+        "customer_name": f"Customer {rng.randrange(50)}",
+        "location": rng.choice(["Bawal", "Gurgaon", "Pune"]),
+        "items": slip_items,
+    }
+
+
+async def _client(port, stop_at, mode, photos, opts, seed, out):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        while time.perf_counter() < stop_at:
+            if mode == "scan":
+                image, expected = rng.choice(photos)
+                if not opts["repeat"]:
+                    # Bytes after the JPEG end marker are ignored by decoders but
+                    # change the content hash, so the decode cache cannot answer
+                    image += os.urandom(8)
+                started = time.perf_counter()
+                status, payload = await _request(reader, writer, "POST", "/scan?profile=any", image, "image/jpeg")
+                if status == 200:
+                    out["correct"] += payload["code"] == expected
+            else:
+                body = json.dumps(_slip(rng, photos, opts["items"], opts["photo_ratio"])).encode()
+                started = time.perf_counter()
+                status, payload = await _request(reader, writer, "POST", "/slips", body, "application/json")
+            elapsed = time.perf_counter() - started
+            out["status"][status] = out["status"].get(status, 0) + 1
+            if status in (200, 201):
+                out["latency"].append(elapsed)
+            elif status == 503:
+                # Back off as Retry-After asks, a little less to keep pressure on
+                await asyncio.sleep(0.05 + rng.random() * 0.1)
+    finally:
+        writer.close()
+
+
+async def _drive(port, connections, duration, mode, photos, opts):
+    out = {"status": {}, "latency": [], "correct": 0}
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        _client(port, started + duration, mode, photos, opts, seed, out) for seed in range(connections)
+    ))
+    out["elapsed"] = time.perf_counter() - started
+    return out
+
+
+def _wait_healthy(port, proc):
+    async def probe():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            return await _request(reader, writer, "GET", "/health")
+        finally:
+            writer.close()
+
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("ingest service exited during start-up")
+        try:
+            return asyncio.run(probe())[1]
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("ingest service did not start")
+
+
+def run_load(mode="scan", connections=32, duration=10.0, workers=None, manager="db_manager",
+             max_side=MAX_SIDE, items=12, photo_ratio=0.25, corpus_dir=None, workdir=None, port=8601,
+             repeat=False):
+    """Start the service, drive it and return the results dict."""
+    workdir = workdir or tempfile.mkdtemp(prefix="ingest-load-")
+    photos = load_photos(corpus_dir or os.path.join(workdir, "corpus"), max_side)
+
+    db_var, image_var = MANAGERS[manager]
+    env = dict(os.environ, **{db_var: os.path.join(workdir, "ingest.db"), image_var: os.path.join(workdir, "images")})
+    env.pop("PACKING_METRICS_PORT", None)
+    command = [sys.executable, "ingest.py", "--port", str(port), "--manager", manager]
+    if workers:
+        command += ["--workers", str(workers)]
+    proc = subprocess.Popen(command, cwd=PROJECT_ROOT, env=env)
+    try:
+        health = _wait_healthy(port, proc)
+        out = asyncio.run(_drive(port, connections, duration, mode, photos,
+                                 {"items": items, "photo_ratio": photo_ratio, "repeat": repeat}))
+    finally:
+        proc.send_signal(signal.SIGINT)
+        proc.wait(60)
+
+    with sqlite3.connect(env[db_var]) as conn:
+        slips, item_rows = conn.execute(
+            "SELECT (SELECT COUNT(*) FROM packing_slip), (SELECT COUNT(*) FROM packing_items)"
+        ).fetchone()
+    ok = len(out["latency"])
+    return {
+        "mode": mode,
+        "connections": connections,
+        "workers": health["workers"],
+        "cpus": os.cpu_count(),
+        "duration_s": round(out["elapsed"], 2),
+        f"{'images' if mode == 'scan' else 'slips'}_per_s": round(ok / out["elapsed"], 1),
+        "latency": _percentiles(out["latency"]),
+        "status": out["status"],
+        "accuracy": round(out["correct"] / ok, 3) if mode == "scan" and ok else None,
+        "slips_committed": slips,
+        "items_committed": item_rows,
+        "mean_image_kb": round(sum(len(p) for p, _ in photos) / len(photos) / 1024, 1),
+        "workdir": workdir,
+    }
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load test for the ingest service")
+    parser.add_argument("--mode", choices=["scan", "slips"], default="scan")
+    parser.add_argument("--connections", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--workers", type=int, help="decode workers (default: one per CPU)")
+    parser.add_argument("--manager", choices=sorted(MANAGERS), default="db_manager")
+    parser.add_argument("--max-side", type=int, default=MAX_SIDE)
+    parser.add_argument("--items", type=float, default=12, help="mean items per slip")
+    parser.add_argument("--photo-ratio", type=float, default=0.25, help="share of slip items sent as photos")
+    parser.add_argument("--corpus", help="corpus directory (default: build a small one)")
+    parser.add_argument("--workdir", help="scratch directory (default: a new temp dir)")
+    parser.add_argument("--port", type=int, default=8601)
+    parser.add_argument("--repeat", action="store_true", help="send identical photo bytes again (decode cache hits)")
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args(argv)
+
+    results = run_load(
+        args.mode, args.connections, args.duration, args.workers, args.manager, args.max_side,
+        args.items, args.photo_ratio, args.corpus, args.workdir, args.port, args.repeat,
+    )
+    print(json.dumps(results, indent=1))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
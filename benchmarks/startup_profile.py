@@ -0,0 +1,149 @@
+"""
+Startup profile of the Streamlit apps: cold start and per-rerun overhead.
+
+    python -m benchmarks.startup_profile main.py main1.py --out after.json
+    python -m benchmarks.startup_profile main.py --compare before.json
+
+Each script runs in a fresh interpreter under -X importtime through
+Streamlit's AppTest: the first run is the cold start, later runs are
+plain reruns and a rerun triggered by typing into the first text box
+(what a packer does most). Reported per script: first-run and rerun
+times, the heaviest top-level imports, and which heavy libraries were
+loaded before any photo was taken. Check out the previous commit and
+run with --out to get the "before" numbers.
+
+The apps run against a scratch database (PACKING_DB / PACKING1_DB).
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Libraries that should stay unloaded until a photo is decoded or exported
+HEAVY_MODULES = ("cv2", "numpy", "pandas", "PIL", "pyzbar", "pyarrow", "xlrd")
+RERUNS = 3
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def _child(script, reruns):
+    """Runs inside the profiled interpreter; prints one JSON line."""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(script, default_timeout=300)
+    started = time.perf_counter()
+    app.run()
+    first = time.perf_counter() - started
+
+    rerun_times = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        app.run()
+        rerun_times.append(time.perf_counter() - started)
+
+    typing = None
+    if app.text_input:
+        started = time.perf_counter()
+        app.text_input[0].input("Acme").run()
+        typing = time.perf_counter() - started
+
+    print(json.dumps({
+        "first_run_ms": round(first * 1000, 1),
+        "rerun_ms": [round(t * 1000, 1) for t in rerun_times],
+        "typing_rerun_ms": round(typing * 1000, 1) if typing is not None else None,
+        "exception": [str(e.value) for e in app.exception],
+        "heavy_loaded": sorted(m for m in HEAVY_MODULES if m in sys.modules),
+    }))
+
+
+def _top_imports(stderr, limit=10):
+    """Top-level imports by cumulative microseconds from -X importtime output."""
+    totals = {}
+    for line in stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match and len(match.group(3)) <= 1:
+            name = match.group(4).split(".")[0]
+            totals[name] = totals.get(name, 0) + int(match.group(2))
+    ranked = sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+    return [{"module": name, "ms": round(us / 1000, 1)} for name, us in ranked]
+
+
+def profile_script(script, reruns=RERUNS):
+    """Profile one app script in a fresh interpreter; returns its results dict."""
+    scratch = tempfile.mkdtemp(prefix="startup-profile-")
+    env = dict(os.environ)
+    env.update({
+        "PACKING_DB": os.path.join(scratch, "packing.db"),
+        "PACKING_IMAGE_DIR": os.path.join(scratch, "images"),
+        "PACKING1_DB": os.path.join(scratch, "packing1.db"),
+        "PACKING1_IMAGE_DIR": os.path.join(scratch, "images1"),
+        "PYTHONPATH": PROJECT_ROOT,
+    })
+    env.pop("PACKING_METRICS_PORT", None)
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "benchmarks.startup_profile",
+         "--child", os.path.abspath(script), "--reruns", str(reruns)],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - started
+    lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+    if proc.returncode or not lines:
+        return {"script": script, "error": proc.stderr.strip().splitlines()[-1:] or ["no output"]}
+    result = json.loads(lines[-1])
+    result.update({
+        "script": script,
+        "process_wall_ms": round(wall * 1000, 1),
+        "top_imports": _top_imports(proc.stderr),
+    })
+    return result
+
+
+def compare(before, after):
+    """Lines describing how each script's cold start and reruns changed."""
+    lines = []
+    old = {r["script"]: r for r in before}
+    for result in after:
+        prev = old.get(result["script"])
+        if not prev or "error" in prev or "error" in result:
+            continue
+        lines.append(
+            f"{result['script']}: first run {prev['first_run_ms']} -> {result['first_run_ms']} ms, "
+            f"rerun {min(prev['rerun_ms'])} -> {min(result['rerun_ms'])} ms, "
+            f"heavy at start {prev['heavy_loaded']} -> {result['heavy_loaded']}"
+        )
+    return lines
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Profile Streamlit app cold start and reruns")
+    parser.add_argument("scripts", nargs="*", default=["main.py", "main1.py"])
+    parser.add_argument("--reruns", type=int, default=RERUNS)
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        _child(args.child, args.reruns)
+        return
+
+    results = [profile_script(script, args.reruns) for script in args.scripts]
+    print(json.dumps(results, indent=1))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            for line in compare(json.load(f), results):
+                print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from modules import metrics
+
+logger = logging.getLogger(__name__)
+
+BUSY_TIMEOUT_MS = 5000
+
+# Applied to every connection the pool opens. WAL lets readers run while
+# one writer commits; NORMAL sync is durable across app crashes in WAL mode.
+PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -16000),       # KiB, i.e. 16 MB of page cache per connection
+    ("mmap_size", 268435456),     # 256 MB memory-mapped reads
+    ("busy_timeout", BUSY_TIMEOUT_MS),  # ms to wait on a lock before "database is locked"
+    ("temp_store", "MEMORY"),
+)
+
+# sqlite3 keeps this many compiled statements per connection; pooled
+# connections live for the whole process, so repeated SQL is prepared once.
+CACHED_STATEMENTS = 256
+DEFAULT_POOL_SIZE = 8
+
+_pools = {}
+_initialised = set()
+_registry_lock = threading.RLock()
+
+
+def open_connection(db_path):
+    """Open a new connection with the standard pragmas applied."""
+    metrics.inc("db_connections_opened")
+    with metrics.timer("db_connect_seconds"):
+        return _connect(db_path)
+
+
+def _connect(db_path):
+    conn = sqlite3.connect(
+        db_path,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        cached_statements=CACHED_STATEMENTS,
+    )
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name}={value}")
+    return conn
+
+
+class ConnectionPool:
+    """
+    A bounded set of long-lived connections to one database file.
+
+    Connections are handed out one caller at a time, so any thread may use
+    them; a caller waits when all max_size connections are busy.
+    """
+
+    def __init__(self, db_path, max_size=DEFAULT_POOL_SIZE):
+        self.db_path = db_path
+        self.max_size = max_size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _checkout(self, timeout):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.max_size:
+                self._created += 1
+                try:
+                    return open_connection(self.db_path)
+                except Exception:
+                    self._created -= 1
+                    raise
+        return self._idle.get(timeout=timeout)
+
+    @contextmanager
+    def connection(self, timeout=30):
+        """Borrow a connection; any open transaction is rolled back on return."""
+        with metrics.timer("db_pool_wait_seconds"):
+            conn = self._checkout(timeout)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self, timeout=30):
+        """Borrow a connection and commit on success, roll back on error."""
+        with self.connection(timeout) as conn:
+            try:
+                yield conn
+                with metrics.timer("db_commit_seconds"):
+                    conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+def get_pool(db_path, max_size=DEFAULT_POOL_SIZE):
+    """Return the process-wide pool for a database file."""
+    key = os.path.abspath(db_path)
+    with _registry_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(key, max_size)
+        return pool
+
+
+def run_once(db_path, setup):
+    """
+    Call setup(conn) the first time a database is used in this process.
+
+    Later calls for the same file return immediately, so schema checks
+    and migrations are not repeated on every Streamlit rerun.
+    """
+    key = os.path.abspath(db_path)
+    with _registry_lock:
+        if key in _initialised:
+            return False
+        with get_pool(key).connection() as conn:
+            setup(conn)
+            conn.commit()
+        _initialised.add(key)
+        logger.info(f"Schema ready for {key}")
+        return True
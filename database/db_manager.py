@@ -1,11 +1,57 @@
 import os
 import sqlite3
+from database.connection import get_pool, open_connection, run_once
+from database.image_store import ImageStore, ensure_image_hash_column, migrate_blobs
+from database.writer import WriteBehindQueue
+from database.migrations import COMMON_INDEXES, apply_migrations
+from database.queries import PackingQueries
+from database.totals import ITEM_DAY_BY_SLIP, TOTALS_TABLES, TotalsDelta, day_of, rebuild_statements
+
+# PACKING_DB / PACKING_IMAGE_DIR point the app (or a load test) at other files
+DB_PATH = os.environ.get("PACKING_DB", "packing.db")
+
+# Item photos live on disk, addressed by content hash; the table keeps the hash.
+image_store = ImageStore(os.environ.get("PACKING_IMAGE_DIR", "packing_images"))
+
+# Shared, WAL-mode connections reused across calls and Streamlit sessions.
+pool = get_pool(DB_PATH)
+
+# Indexed header/item/date/customer lookups
+queries = PackingQueries(pool)
+
+# Schema versions after the base tables (see database.migrations).
+MIGRATIONS = [
+    (1, COMMON_INDEXES + [
+        "CREATE INDEX IF NOT EXISTS idx_slip_header ON packing_slip (header_id)",
+    ]),
+    # Headers repeat here, so each item remembers the slip it was saved
+    # with; older rows get their header's newest slip
+    (2, [
+        "ALTER TABLE packing_items ADD COLUMN slip_id INTEGER",
+        """UPDATE packing_items SET slip_id =
+            (SELECT max(s.id) FROM packing_slip s WHERE s.header_id = packing_items.header_id)""",
+    ]),
+    # Packed-quantity totals (database.totals), filled from the rows already there
+    (3, TOTALS_TABLES + rebuild_statements(ITEM_DAY_BY_SLIP)),
+]
+
+# Items count on the day of the slip they were saved with
+TOTALS_ITEM_DAY = ITEM_DAY_BY_SLIP
+
+INSERT_SLIP = """
+    INSERT INTO packing_slip (header_id, customer_name, location, time_of_packing)
+    VALUES (?, ?, ?, ?)
+"""
+INSERT_ITEM = """
+    INSERT INTO packing_items (header_id, item_id, description, quantity, image_hash, slip_id)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
 
 def create_connection():
-    return sqlite3.connect("packing.db")
+    """Open a standalone connection (caller closes it) with the pool's pragmas."""
+    return open_connection(DB_PATH)
 
-def create_tables():
-    conn = create_connection()
+def _create_tables(conn):
     cursor = conn.cursor()
     # Use "IF NOT EXISTS" so existing tables and data are unchanged.
     cursor.execute("""
@@ -24,38 +70,82 @@ def create_tables():
             item_id TEXT,
             description TEXT,
             quantity INTEGER,
-            image BLOB
+            image BLOB,
+            image_hash TEXT
         )
     """)
+    ensure_image_hash_column(cursor)
     conn.commit()
-    conn.close()
+    migrate_blobs(conn, image_store)
+    apply_migrations(conn, MIGRATIONS)
 
-def save_packing_slip(header_info, items):
-    conn = create_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO packing_slip (header_id, customer_name, location, time_of_packing)
-        VALUES (?, ?, ?, ?)
-    """, (
+def create_tables():
+    """Create missing tables and run migrations; only the first call per process does work."""
+    run_once(DB_PATH, _create_tables)
+
+def _prepare(header_info, items):
+    """Turn a slip into (slip row, item rows), storing photos on the way."""
+    slip_row = (
         header_info["header_id"],
         header_info["customer_name"],
         header_info["location"],
         header_info["time_of_packing"]
-    ))
-    for item in items:
-        cursor.execute("""
-            INSERT INTO packing_items (header_id, item_id, description, quantity, image)
-            VALUES (?, ?, ?, ?, ?)
-        """, (
-            header_info["header_id"],
-            item["item_id"],
-            item["description"],
-            item["quantity"],
-            item["image"]
-        ))
-    conn.commit()
-    conn.close()
+    )
+    item_rows = [(
+        header_info["header_id"],
+        item["item_id"],
+        item["description"],
+        item["quantity"],
+        item.get("image_hash") or image_store.put(item.get("image"))
+    ) for item in items]
+    return slip_row, item_rows
+
+def _write_prepared(prepared):
+    """Write many prepared slips in one transaction."""
+    # Importing this module no longer touches the database; the first write does
+    create_tables()
+    with pool.transaction() as conn:
+        item_rows = []
+        totals = TotalsDelta()
+        for slip_row, rows in prepared:
+            slip_id = conn.execute(INSERT_SLIP, slip_row).lastrowid
+            day = day_of(slip_row[3])
+            totals.slip(day)
+            for row in rows:
+                totals.item(row[0], row[1], day, row[3])
+            item_rows += [row + (slip_id,) for row in rows]
+        conn.executemany(INSERT_ITEM, item_rows)
+        totals.apply(conn)
+
+def save_packing_slip(header_info, items):
+    _write_prepared([_prepare(header_info, items)])
+
+def save_packing_slips(slips):
+    """Save a list of (header_info, items) pairs in a single transaction."""
+    _write_prepared([_prepare(header_info, items) for header_info, items in slips])
+
+_writer = None
+
+def get_writer():
+    """The background write-behind queue, started on first use."""
+    global _writer
+    if _writer is None:
+        _writer = WriteBehindQueue(_write_prepared)
+    return _writer
+
+def save_packing_slip_async(header_info, items, timeout=None):
+    """
+    Queue a slip for the background writer and return a Future that
+    resolves once it has been committed. Raises queue.Full if the writer
+    is still backed up after timeout seconds (0 fails at once).
+    """
+    return get_writer().submit(_prepare(header_info, items), timeout=timeout)
+
+def flush_writes():
+    """Block until every queued slip has been committed."""
+    if _writer is not None:
+        _writer.flush()
 
-# Call create_tables() on startup so that missing tables are added,
-# but do not delete the database file.
-create_tables()
+def load_item_image(image_hash):
+    """Fetch an item photo from the image store only when it is displayed or exported."""
+    return image_store.get(image_hash)
@@ -1,16 +1,53 @@
 import sqlite3
 import os
-from typing import List, Dict
+from concurrent.futures import Future
+from typing import List, Dict, Optional, Tuple
+from database.connection import get_pool, open_connection, run_once
+from database.image_store import ImageStore, ensure_image_hash_column, migrate_blobs
+from database.writer import WriteBehindQueue
+from database.migrations import COMMON_INDEXES, apply_migrations
+from database.queries import PackingQueries
+from database.totals import ITEM_DAY_BY_HEADER, TOTALS_TABLES, TotalsDelta, day_of, rebuild_statements
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "packing1.db")
+# PACKING1_DB / PACKING1_IMAGE_DIR override the files next to this module
+DB_PATH = os.environ.get("PACKING1_DB", os.path.join(os.path.dirname(__file__), "packing1.db"))
+IMAGE_DIR = os.environ.get("PACKING1_IMAGE_DIR", os.path.join(os.path.dirname(__file__), "packing1_images"))
 
-def create_connection():
-    """Create thread-safe database connection"""
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+# Item photos live on disk, addressed by content hash; the table keeps the hash.
+image_store = ImageStore(IMAGE_DIR)
 
-def create_tables():
-    """Initialize database schema"""
-    conn = create_connection()
+# Shared, WAL-mode connections reused across calls and Streamlit sessions
+pool = get_pool(DB_PATH)
+
+# Indexed header/item/date/customer lookups
+queries = PackingQueries(pool)
+
+# Schema versions after the base tables; header_id is already UNIQUE here
+MIGRATIONS = [
+    (1, COMMON_INDEXES),
+    # Packed-quantity totals (database.totals), filled from the rows already there
+    (2, TOTALS_TABLES + rebuild_statements(ITEM_DAY_BY_HEADER)),
+]
+
+# A header has one slip here; its items count on that slip's day
+TOTALS_ITEM_DAY = ITEM_DAY_BY_HEADER
+
+UPSERT_SLIP = """
+    INSERT OR REPLACE INTO packing_slip
+    (header_id, customer_name, location, time_of_packing)
+    VALUES (?, ?, ?, ?)
+"""
+UPSERT_ITEM = """
+    INSERT OR REPLACE INTO packing_items
+    (header_id, item_id, description, quantity, image_hash)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+def create_connection() -> sqlite3.Connection:
+    """Create thread-safe standalone database connection (caller closes it)"""
+    return open_connection(DB_PATH)
+
+def _create_tables(conn: sqlite3.Connection):
     cursor = conn.cursor()
     
     # Packing slip header table
@@ -32,51 +69,123 @@ def create_tables():
         description TEXT,
         quantity INTEGER DEFAULT 1,
         image BLOB,
+        image_hash TEXT,
         FOREIGN KEY (header_id) REFERENCES packing_slip (header_id),
         UNIQUE (header_id, item_id)
     )""")
+    ensure_image_hash_column(cursor)
     
     conn.commit()
-    conn.close()
+    # Move BLOBs written before the image store existed out of the table
+    migrate_blobs(conn, image_store)
+    apply_migrations(conn, MIGRATIONS)
+
+def create_tables():
+    """Initialize database schema once per process"""
+    run_once(DB_PATH, _create_tables)
+
+def _prepare(header_info: Dict, items: List[Dict]) -> Tuple[tuple, List[tuple]]:
+    """Turn a slip into (slip row, item rows), storing photos on the way"""
+    slip_row = (
+        header_info["header_id"],
+        header_info["customer_name"],
+        header_info.get("location"),
+        header_info["time_of_packing"]
+    )
+    # (header_id, item_id) is unique, so the same part listed twice in one
+    # slip is merged here; INSERT OR REPLACE would keep only the last quantity
+    merged: Dict[str, tuple] = {}
+    for item in items:
+        row = (
+            header_info["header_id"],
+            item["item_id"],
+            item.get("description", ""),
+            item.get("quantity", 1),
+            item.get("image_hash") or image_store.put(item.get("image"))
+        )
+        previous = merged.get(item["item_id"])
+        merged[item["item_id"]] = _merge(previous, row) if previous else row
+    return slip_row, list(merged.values())
+
+def _merge(previous: tuple, row: tuple) -> tuple:
+    """One item row for a part listed again under a header: quantities add up"""
+    return row[:2] + (row[2] or previous[2], (previous[3] or 0) + (row[3] or 0), row[4] or previous[4])
+
+def _write_prepared(prepared: List[Tuple[tuple, List[tuple]]]):
+    """Write many prepared slips in one transaction, updating the totals"""
+    # Schema is set up by the first write (or the app's startup), not on import
+    create_tables()
+    headers = list({slip_row[0] for slip_row, _ in prepared})
+    marks = ", ".join("?" * len(headers))
+    with pool.transaction() as conn:
+        # Take the write lock before reading what is already saved under
+        # these headers, so a concurrent save cannot slip in between
+        conn.execute("BEGIN IMMEDIATE")
+        slip_days = {
+            header: day_of(time_of_packing) for header, time_of_packing in conn.execute(
+                f"SELECT header_id, time_of_packing FROM packing_slip WHERE header_id IN ({marks})", headers
+            )
+        }
+        saved: Dict[str, Dict[str, tuple]] = {}
+        for row in conn.execute(
+            f"SELECT header_id, item_id, description, quantity, image_hash FROM packing_items WHERE header_id IN ({marks})",
+            headers
+        ):
+            saved.setdefault(row[0], {})[row[1]] = row
+
+        totals = TotalsDelta()
+        slip_rows, item_rows = [], []
+        for slip_row, rows in prepared:
+            header, day = slip_row[0], day_of(slip_row[3])
+            items = saved.setdefault(header, {})
+            if header in slip_days:
+                # Saved again: the slip is replaced and its items go with it
+                old_day = slip_days[header]
+                totals.slip(old_day, -1)
+                if old_day != day:
+                    for item in items.values():
+                        totals.day_item(old_day, item[1], -(item[3] or 0), -1)
+                        totals.day_item(day, item[1], item[3] or 0)
+            totals.slip(day)
+            slip_days[header] = day
+            for row in rows:
+                previous = items.get(row[1])
+                # A part saved again under the same header adds to its quantity
+                totals.item(header, row[1], day, row[3], lines=0 if previous else 1)
+                items[row[1]] = row = _merge(previous, row) if previous else row
+                item_rows.append(row)
+            slip_rows.append(slip_row)
+        conn.executemany(UPSERT_SLIP, slip_rows)
+        conn.executemany(UPSERT_ITEM, item_rows)
+        totals.apply(conn)
 
 def save_packing_slip(header_info: Dict, items: List[Dict]):
     """Save complete packing slip with transaction handling"""
-    conn = create_connection()
-    cursor = conn.cursor()
-    
-    try:
-        # Insert/update header
-        cursor.execute("""
-        INSERT OR REPLACE INTO packing_slip
-        (header_id, customer_name, location, time_of_packing)
-        VALUES (?, ?, ?, ?)
-        """, (
-            header_info["header_id"],
-            header_info["customer_name"],
-            header_info.get("location"),
-            header_info["time_of_packing"]
-        ))
-        
-        # Insert/update items
-        for item in items:
-            cursor.execute("""
-            INSERT OR REPLACE INTO packing_items
-            (header_id, item_id, description, quantity, image)
-            VALUES (?, ?, ?, ?, ?)
-            """, (
-                header_info["header_id"],
-                item["item_id"],
-                item.get("description", ""),
-                item.get("quantity", 1),
-                item.get("image")
-            ))
-        
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
-
-# Initialize tables on module import
-create_tables()
\ No newline at end of file
+    _write_prepared([_prepare(header_info, items)])
+
+def save_packing_slips(slips: List[Tuple[Dict, List[Dict]]]):
+    """Save many (header_info, items) pairs in a single transaction"""
+    _write_prepared([_prepare(header_info, items) for header_info, items in slips])
+
+_writer: Optional[WriteBehindQueue] = None
+
+def get_writer() -> WriteBehindQueue:
+    """Background write-behind queue, started on first use"""
+    global _writer
+    if _writer is None:
+        _writer = WriteBehindQueue(_write_prepared)
+    return _writer
+
+def save_packing_slip_async(header_info: Dict, items: List[Dict], timeout: Optional[float] = None) -> Future:
+    """Queue a slip for the background writer; the Future resolves after commit.
+    Raises queue.Full if the writer is still backed up after timeout seconds."""
+    return get_writer().submit(_prepare(header_info, items), timeout=timeout)
+
+def flush_writes():
+    """Block until every queued slip has been committed"""
+    if _writer is not None:
+        _writer.flush()
+
+def load_item_image(image_hash: Optional[str]) -> Optional[bytes]:
+    """Load an item photo lazily from the image store"""
+    return image_store.get(image_hash)
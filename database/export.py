@@ -0,0 +1,353 @@
+import csv
+import io
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+import zipfile
+from collections import namedtuple
+
+from modules import metrics
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched from SQLite per round trip; bounds exporter memory.
+BATCH_SIZE = 1000
+
+SLIP_COLUMNS = ["id", "header_id", "customer_name", "location", "time_of_packing"]
+# The image BLOB column is never exported; image_hash points into the image store.
+ITEM_COLUMNS = ["id", "header_id", "item_id", "description", "quantity", "image_hash"]
+
+# Parquet exports stream this many rows per Arrow batch / file.
+PARQUET_BATCH_SIZE = 50000
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Highest row ids included in an export; pass back as `since` for the next one.
+ExportCursor = namedtuple("ExportCursor", ["slip_id", "item_id"])
+# start/end are "%Y-%m-%d[ %H:%M:%S]" strings, end exclusive.
+ExportFilter = namedtuple("ExportFilter", ["start", "end", "customer"], defaults=(None, None, None))
+
+
+def iter_rows(conn, sql, params=(), batch_size=BATCH_SIZE):
+    """Yield rows from a query without ever holding more than one batch."""
+    cursor = conn.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield from rows
+
+
+def _slip_where(filters):
+    where, params = [], []
+    if filters.start:
+        where.append("s.time_of_packing >= ?")
+        params.append(filters.start)
+    if filters.end:
+        where.append("s.time_of_packing < ?")
+        params.append(filters.end)
+    if filters.customer:
+        where.append("s.customer_name = ?")
+        params.append(filters.customer)
+    return where, params
+
+
+def slip_query(filters=ExportFilter(), since=None):
+    where, params = _slip_where(filters)
+    if since is not None:
+        where.append("s.id > ?")
+        params.append(since.slip_id)
+    sql = f"SELECT {', '.join('s.' + c for c in SLIP_COLUMNS)} FROM packing_slip s"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql + " ORDER BY s.id", params
+
+
+def item_query(filters=ExportFilter(), since=None, by_slip=False):
+    """
+    Items of the slips the filters select. With by_slip (db_manager, where
+    a header can have several slips) an item belongs to the slip it was
+    saved with, not to every slip of its header.
+    """
+    slip_where, params = _slip_where(filters)
+    where = []
+    if slip_where:
+        if by_slip:
+            where.append("i.slip_id IN (SELECT s.id FROM packing_slip s WHERE " + " AND ".join(slip_where) + ")")
+        else:
+            where.append(
+                "i.header_id IN (SELECT s.header_id FROM packing_slip s WHERE " + " AND ".join(slip_where) + ")"
+            )
+    if since is not None:
+        where.append("i.id > ?")
+        params.append(since.item_id)
+    sql = f"SELECT {', '.join('i.' + c for c in ITEM_COLUMNS)} FROM packing_items i"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql + " ORDER BY i.id", params
+
+
+def has_slip_id(conn):
+    """True for db_manager's schema, where items record the slip they were saved with."""
+    return any(row[1] == "slip_id" for row in conn.execute("PRAGMA table_info(packing_items)"))
+
+
+def _write_csv(zip_file, name, columns, rows):
+    """Stream rows into a CSV member of the ZIP; returns (row count, max id)."""
+    count, max_id = 0, None
+    with zip_file.open(name, "w", force_zip64=True) as member:
+        text = io.TextIOWrapper(member, encoding="utf-8", newline="")
+        writer = csv.writer(text)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+            max_id = row[0]
+        text.flush()
+        text.detach()
+    return count, max_id
+
+
+def load_cursor(conn, name):
+    """Return the saved ExportCursor for an incremental export, or None."""
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS export_cursors "
+        "(name TEXT PRIMARY KEY, slip_id INTEGER, item_id INTEGER)"
+    )
+    row = conn.execute("SELECT slip_id, item_id FROM export_cursors WHERE name = ?", (name,)).fetchone()
+    return ExportCursor(*row) if row else None
+
+
+def save_cursor(conn, name, cursor):
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO export_cursors (name, slip_id, item_id) VALUES (?, ?, ?)",
+            (name, cursor.slip_id, cursor.item_id)
+        )
+
+
+def cursor_name(name, filters=ExportFilter()):
+    """
+    Name a cursor is saved under: one per filter, since a cursor moved
+    past rows a filter left out would skip them in an unfiltered export.
+    """
+    if filters == ExportFilter():
+        return name
+    return f"{name}|customer={filters.customer or ''}|start={filters.start or ''}|end={filters.end or ''}"
+
+
+def advance_cursor(pool, name, cursor):
+    """Save the cursor an export returned, once its file has been delivered."""
+    with pool.connection() as conn:
+        save_cursor(conn, name, cursor)
+    logger.info(f"Export cursor {name} now at slip {cursor.slip_id}, item {cursor.item_id}")
+
+
+def export_zip(pool, out, filters=ExportFilter(), since=None, image_store=None):
+    """
+    Write packing_slip.csv and packing_items.csv into a ZIP at `out`
+    (path or binary file object), streaming rows batch by batch.
+
+    With `since`, only rows added after that cursor are exported. With an
+    image_store, the referenced photos are copied into images/<hash>
+    one file at a time. Returns the ExportCursor for the next incremental run.
+    """
+    with metrics.timer("export_seconds", format="csv"):
+        return _export_zip(pool, out, filters, since, image_store)
+
+
+def _export_zip(pool, out, filters, since, image_store):
+    with pool.connection() as conn, zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+        sql, params = slip_query(filters, since)
+        slips, slip_max = _write_csv(zip_file, "packing_slip.csv", SLIP_COLUMNS, iter_rows(conn, sql, params))
+
+        sql, params = item_query(filters, since, by_slip=has_slip_id(conn))
+        hashes = set() if image_store is not None else None
+
+        def item_rows():
+            for row in iter_rows(conn, sql, params):
+                if hashes is not None and row[-1]:
+                    hashes.add(row[-1])
+                yield row
+
+        items, item_max = _write_csv(zip_file, "packing_items.csv", ITEM_COLUMNS, item_rows())
+
+        for image_hash in sorted(hashes or ()):
+            path = image_store.path(image_hash)
+            if os.path.exists(path):
+                zip_file.write(path, f"images/{image_hash}", compress_type=zipfile.ZIP_STORED)
+
+    logger.info(f"Exported {slips} slips and {items} items")
+    return ExportCursor(
+        slip_max if slip_max is not None else (since.slip_id if since else 0),
+        item_max if item_max is not None else (since.item_id if since else 0),
+    )
+
+
+def export_zip_file(pool, filters=ExportFilter(), incremental=None, image_store=None):
+    """
+    Export to a temporary ZIP file on disk; returns (path, cursor).
+
+    With incremental set to a name, the export starts after the cursor
+    saved under that name and these filters (see cursor_name). The cursor
+    is not moved: once the file has reached the user, pass the returned
+    one to advance_cursor. The caller deletes the file when done.
+    """
+    since = None
+    if incremental:
+        with pool.connection() as conn:
+            since = load_cursor(conn, cursor_name(incremental, filters))
+    fd, path = tempfile.mkstemp(suffix=".zip")
+    with os.fdopen(fd, "wb") as out:
+        cursor = export_zip(pool, out, filters, since, image_store)
+    return path, cursor
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+    return pa, pc, pq
+
+
+def _arrow_batch(pa, pc, columns, rows, dictionary_columns):
+    """Build an Arrow table from row tuples with real timestamps and dictionary strings."""
+    values = list(zip(*rows))
+    arrays, names = [], []
+    for name, column in zip(columns, values):
+        if name == "time_of_packing":
+            array = pc.strptime(pa.array(column, pa.string()), format=TIME_FORMAT, unit="s", error_is_null=True)
+        elif name in ("id", "quantity"):
+            array = pa.array(column, pa.int64())
+        else:
+            array = pa.array(column, pa.string())
+            if name in dictionary_columns:
+                array = array.dictionary_encode()
+        arrays.append(array)
+        names.append(name)
+    table = pa.Table.from_arrays(arrays, names=names)
+    packing_date = pc.strftime(table["time_of_packing"], format="%Y-%m-%d")
+    return table.append_column("packing_date", pc.fill_null(packing_date, "unknown"))
+
+
+def _write_partitions(pq, table, root, basename):
+    pq.write_to_dataset(
+        table, root,
+        partition_cols=["packing_date"],
+        basename_template=basename + "-{i}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def export_parquet(pool, root, filters=ExportFilter(), since=None, batch_size=PARQUET_BATCH_SIZE):
+    """
+    Append packing_slip and packing_items to Parquet datasets under `root`,
+    hive-partitioned by packing date (root/packing_items/packing_date=YYYY-MM-DD/).
+
+    time_of_packing becomes a timestamp column and customer_name, location
+    and item_id are dictionary-encoded. Every call writes new uniquely
+    named files, so incremental exports (`since`) add to the existing
+    partitions. Items carry their slip's time_of_packing. Returns the
+    ExportCursor for the next incremental run.
+    """
+    with metrics.timer("export_seconds", format="parquet"):
+        return _export_parquet(pool, root, filters, since, batch_size)
+
+
+def _export_parquet(pool, root, filters, since, batch_size):
+    pa, pc, pq = _import_pyarrow()
+    run_id = uuid.uuid4().hex[:12]
+
+    sql, params = slip_query(filters, since)
+
+    max_ids = {}
+    with pool.connection() as conn:
+        by_slip = has_slip_id(conn)
+        item_sql, item_params = item_query(filters, since, by_slip)
+        # Items have no timestamp of their own; partition them by the slip
+        # they were saved with (db_manager), or their header's only slip
+        if by_slip:
+            slip_time = "(SELECT s2.time_of_packing FROM packing_slip s2 WHERE s2.id = i.slip_id)"
+        else:
+            slip_time = "(SELECT MAX(s2.time_of_packing) FROM packing_slip s2 WHERE s2.header_id = i.header_id)"
+        item_sql = item_sql.replace(
+            " FROM packing_items i", f", {slip_time} AS time_of_packing FROM packing_items i", 1
+        )
+        jobs = (
+            ("packing_slip", sql, params, SLIP_COLUMNS, ("customer_name", "location")),
+            ("packing_items", item_sql, item_params, ITEM_COLUMNS + ["time_of_packing"], ("item_id",)),
+        )
+        for table_name, sql, params, columns, dictionary_columns in jobs:
+            cursor = conn.execute(sql, params)
+            batch_no = 0
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                table = _arrow_batch(pa, pc, columns, rows, dictionary_columns)
+                _write_partitions(pq, table, os.path.join(root, table_name), f"{run_id}-{batch_no}")
+                max_ids[table_name] = rows[-1][0]
+                batch_no += 1
+            logger.info(f"Exported {table_name} to Parquet in {batch_no} batches")
+
+    return ExportCursor(
+        max_ids.get("packing_slip", since.slip_id if since else 0),
+        max_ids.get("packing_items", since.item_id if since else 0),
+    )
+
+
+def _zip_directory(root, out):
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_STORED) as zip_file:
+        for folder, _, files in os.walk(root):
+            for name in files:
+                path = os.path.join(folder, name)
+                zip_file.write(path, os.path.relpath(path, root))
+
+
+def export_parquet_zip_file(pool, filters=ExportFilter(), incremental=None):
+    """
+    Parquet counterpart of export_zip_file: a temp ZIP of the partitioned
+    datasets. Returns (path, cursor); the cursor is not saved here either.
+    """
+    since = None
+    if incremental:
+        with pool.connection() as conn:
+            since = load_cursor(conn, cursor_name(incremental, filters))
+    workdir = tempfile.mkdtemp()
+    try:
+        cursor = export_parquet(pool, workdir, filters, since)
+        fd, path = tempfile.mkstemp(suffix=".zip")
+        with os.fdopen(fd, "wb") as out:
+            _zip_directory(workdir, out)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return path, cursor
+
+
+def main(argv=None):
+    """Append new rows to a local Parquet dataset, e.g. from a nightly cron job."""
+    import argparse
+    import importlib
+
+    parser = argparse.ArgumentParser(description="Incremental Parquet export of packing data")
+    parser.add_argument("out", help="dataset root directory")
+    parser.add_argument("--db", choices=["db_manager", "db_manager1"], default="db_manager")
+    parser.add_argument("--cursor", default="parquet", help="name of the incremental export cursor")
+    args = parser.parse_args(argv)
+
+    manager = importlib.import_module(f"database.{args.db}")
+    manager.create_tables()
+    with manager.pool.connection() as conn:
+        since = load_cursor(conn, args.cursor)
+    cursor = export_parquet(manager.pool, args.out, since=since)
+    with manager.pool.connection() as conn:
+        save_cursor(conn, args.cursor, cursor)
+    print(f"Exported up to slip {cursor.slip_id}, item {cursor.item_id}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import hashlib
+import io
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+class ImageStore:
+    """
+    Content-addressed image files on disk.
+
+    Each image is saved once under the SHA-256 of its stored bytes, as
+    <root>/<first two hex chars>/<hash>. Saving the same photo again is a
+    no-op, so an image shared by many item rows costs one file. With
+    max_side/quality set, images are downsized and re-encoded as JPEG
+    before hashing.
+    """
+
+    def __init__(self, root, max_side=None, quality=None):
+        self.root = root
+        self.max_side = max_side
+        self.quality = quality
+
+    def path(self, image_hash):
+        return os.path.join(self.root, image_hash[:2], image_hash)
+
+    def _recompress(self, image_bytes):
+        from PIL import Image
+
+        img = Image.open(io.BytesIO(image_bytes))
+        if self.max_side:
+            img.thumbnail((self.max_side, self.max_side))
+        out = io.BytesIO()
+        img.convert("RGB").save(out, format="JPEG", quality=self.quality or 85, optimize=True)
+        return out.getvalue()
+
+    def put(self, image_bytes):
+        """Store image bytes and return their hash; None stays None."""
+        if image_bytes is None:
+            return None
+        if self.max_side or self.quality:
+            image_bytes = self._recompress(image_bytes)
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
+        path = self.path(image_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file and rename so readers never see half a file
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(image_bytes)
+            os.replace(tmp, path)
+        return image_hash
+
+    def get(self, image_hash):
+        """Load the bytes of a stored image, or None if unknown."""
+        if not image_hash:
+            return None
+        try:
+            with open(self.path(image_hash), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            logger.warning(f"Image {image_hash} missing from store")
+            return None
+
+    def thumbnail(self, image_hash, size=256):
+        """Return a JPEG thumbnail, generated on first request and kept on disk."""
+        thumb_path = os.path.join(self.root, "thumbs", str(size), image_hash)
+        if os.path.exists(thumb_path):
+            with open(thumb_path, "rb") as f:
+                return f.read()
+        image_bytes = self.get(image_hash)
+        if image_bytes is None:
+            return None
+        from PIL import Image
+
+        img = Image.open(io.BytesIO(image_bytes))
+        img.thumbnail((size, size))
+        out = io.BytesIO()
+        img.convert("RGB").save(out, format="JPEG", quality=80)
+        os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+        with open(thumb_path, "wb") as f:
+            f.write(out.getvalue())
+        return out.getvalue()
+
+
+def ensure_image_hash_column(cursor):
+    """Add packing_items.image_hash to databases created before the image store."""
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(packing_items)")]
+    if "image_hash" not in columns:
+        cursor.execute("ALTER TABLE packing_items ADD COLUMN image_hash TEXT")
+
+
+def migrate_blobs(conn, store, batch_size=100):
+    """
+    Move packing_items.image BLOBs into the store, keeping only the hash.
+
+    Runs in small committed batches so it can be interrupted and resumed.
+    Returns the number of rows moved.
+    """
+    moved = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, image FROM packing_items WHERE image IS NOT NULL LIMIT ?",
+            (batch_size,)
+        ).fetchall()
+        if not rows:
+            break
+        conn.executemany(
+            "UPDATE packing_items SET image_hash = ?, image = NULL WHERE id = ?",
+            [(store.put(bytes(image)), row_id) for row_id, image in rows]
+        )
+        conn.commit()
+        moved += len(rows)
+    if moved:
+        logger.info(f"Moved {moved} item images out of the database")
+    return moved
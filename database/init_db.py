@@ -1,4 +1,9 @@
-from db_manager import create_tables
+import os
+import sys
+
+# Run as a script from database/, so make the project root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database.db_manager import create_tables
 
 def main():
     create_tables()
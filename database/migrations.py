@@ -0,0 +1,49 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn, migrations):
+    """
+    Bring a database up to date with an ordered list of (version, statements).
+
+    The applied version is kept in PRAGMA user_version, so each migration
+    runs once per database file. Every step runs in its own explicit
+    transaction with its version bump: sqlite3 would otherwise commit DDL
+    such as ALTER TABLE at once, and a step failing half-way would leave
+    a change applied that the next run tries again.
+    """
+    current = schema_version(conn)
+    for version, statements in migrations:
+        if version <= current:
+            continue
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN")
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+        logger.info(f"Applied schema migration {version}")
+        current = version
+    return current
+
+
+# Indexes shared by both schemas. Lookups by time go newest first and use
+# (time_of_packing, id) as the keyset, which these indexes cover.
+COMMON_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_slip_time ON packing_slip (time_of_packing)",
+    "CREATE INDEX IF NOT EXISTS idx_slip_customer_time ON packing_slip (customer_name, time_of_packing)",
+    "CREATE INDEX IF NOT EXISTS idx_items_item ON packing_items (item_id, header_id)",
+    # Covering index for items-per-header joins: never touches table pages
+    "CREATE INDEX IF NOT EXISTS idx_items_header_cover "
+    "ON packing_items (header_id, item_id, quantity, description)",
+]
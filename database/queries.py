@@ -0,0 +1,110 @@
+from collections import namedtuple
+
+# rows is a list of dicts; next_cursor is passed back as `after` to get
+# the following page and is None on the last page.
+Page = namedtuple("Page", ["rows", "next_cursor"])
+
+SLIP_COLUMNS = "s.id, s.header_id, s.customer_name, s.location, s.time_of_packing"
+ITEM_COLUMNS = "i.header_id, i.item_id, i.description, i.quantity"
+DEFAULT_PAGE_SIZE = 100
+
+
+def _dicts(cursor):
+    names = [col[0] for col in cursor.description]
+    return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+
+class PackingQueries:
+    """
+    Indexed lookups over packing_slip / packing_items.
+
+    Slip lists are newest first and paginated by keyset: the cursor is the
+    (time_of_packing, id) of the last row returned, so page N costs the
+    same as page 1. Image data is never read.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def _page(self, where, params, after, limit):
+        if after is not None:
+            where.append("(s.time_of_packing, s.id) < (?, ?)")
+            params = list(params) + list(after)
+        sql = (
+            f"SELECT {SLIP_COLUMNS} FROM packing_slip s"
+            + (" WHERE " + " AND ".join(where) if where else "")
+            + " ORDER BY s.time_of_packing DESC, s.id DESC LIMIT ?"
+        )
+        with self.pool.connection() as conn:
+            rows = _dicts(conn.execute(sql, list(params) + [limit]))
+        next_cursor = None
+        if len(rows) == limit:
+            next_cursor = (rows[-1]["time_of_packing"], rows[-1]["id"])
+        return Page(rows, next_cursor)
+
+    def slips_by_header(self, header_id):
+        """Every slip saved under a header id (one for the unique schema)."""
+        with self.pool.connection() as conn:
+            return _dicts(conn.execute(
+                f"SELECT {SLIP_COLUMNS} FROM packing_slip s WHERE s.header_id = ? ORDER BY s.id",
+                (header_id,)
+            ))
+
+    def items_for_header(self, header_id):
+        """Items packed under a header, served from the covering index."""
+        with self.pool.connection() as conn:
+            return _dicts(conn.execute(
+                f"SELECT {ITEM_COLUMNS} FROM packing_items i WHERE i.header_id = ? ORDER BY i.item_id",
+                (header_id,)
+            ))
+
+    def slips_with_item(self, item_id, after=None, limit=DEFAULT_PAGE_SIZE):
+        """Slips that contain a given item id."""
+        where = ["s.header_id IN (SELECT header_id FROM packing_items WHERE item_id = ?)"]
+        return self._page(where, [item_id], after, limit)
+
+    def slips_between(self, start, end, after=None, limit=DEFAULT_PAGE_SIZE):
+        """Slips packed in [start, end); bounds are "%Y-%m-%d[ %H:%M:%S]" strings."""
+        return self._page(["s.time_of_packing >= ?", "s.time_of_packing < ?"], [start, end], after, limit)
+
+    def slips_for_customer(self, customer_name, start=None, end=None, after=None, limit=DEFAULT_PAGE_SIZE):
+        """Slips for one customer, optionally limited to [start, end)."""
+        where, params = ["s.customer_name = ?"], [customer_name]
+        if start is not None:
+            where.append("s.time_of_packing >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("s.time_of_packing < ?")
+            params.append(end)
+        return self._page(where, params, after, limit)
+
+    # Totals below come from the summary tables the managers keep in
+    # database.totals: one primary-key lookup or a short range each.
+
+    def item_total(self, item_id):
+        """{"quantity", "lines"} packed so far for a part, zeros if never packed."""
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT quantity, lines FROM item_totals WHERE item_id = ?", (item_id,)).fetchone()
+        return {"quantity": row[0], "lines": row[1]} if row else {"quantity": 0, "lines": 0}
+
+    def header_total(self, header_id):
+        """{"quantity", "lines"} packed under a header, zeros if unknown."""
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT quantity, lines FROM header_totals WHERE header_id = ?", (header_id,)).fetchone()
+        return {"quantity": row[0], "lines": row[1]} if row else {"quantity": 0, "lines": 0}
+
+    def item_quantity_between(self, item_id, start, end):
+        """Quantity of a part packed on days in [start, end); days are "%Y-%m-%d"."""
+        with self.pool.connection() as conn:
+            return conn.execute(
+                "SELECT ifnull(sum(quantity), 0) FROM daily_item_totals WHERE item_id = ? AND day >= ? AND day < ?",
+                (item_id, start, end)
+            ).fetchone()[0]
+
+    def daily_totals(self, start, end):
+        """Slips and quantity per day for days in [start, end), oldest first."""
+        with self.pool.connection() as conn:
+            return _dicts(conn.execute(
+                "SELECT day, slips, quantity FROM daily_totals WHERE day >= ? AND day < ? ORDER BY day",
+                (start, end)
+            ))
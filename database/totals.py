@@ -0,0 +1,211 @@
+"""
+Packed-quantity totals kept up to date by the managers' save path.
+
+    item_totals        per item_id: quantity and number of item rows
+    header_totals      per header_id: the same
+    daily_item_totals  per (day, item_id)
+    daily_totals       per day: slips saved and quantity packed
+
+An item row counts on the day of the slip it was saved with. In
+db_manager that is packing_items.slip_id, so saving a header again does
+not move earlier items. In db_manager1 a header has one slip, and saving
+it again on another day moves the header's items with it.
+
+Each manager's _write_prepared adds one TotalsDelta per batch in the
+same transaction: a few executemany upserts per batch, not per row.
+The apps only ever insert, so any other change to packing_items or
+packing_slip (ad-hoc SQL, a restore) needs a rebuild:
+
+    python -m database.totals --db db_manager1 [--check]
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+DAY = "substr({}.time_of_packing, 1, 10)"
+
+# The day an item row i counts on (see the module docstring)
+ITEM_DAY_BY_SLIP = f"(SELECT {DAY.format('s')} FROM packing_slip s WHERE s.id = i.slip_id)"
+ITEM_DAY_BY_HEADER = f"(SELECT {DAY.format('s')} FROM packing_slip s WHERE s.header_id = i.header_id)"
+
+TOTALS_TABLES = [
+    """CREATE TABLE IF NOT EXISTS item_totals (
+        item_id TEXT PRIMARY KEY NOT NULL,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        lines INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS header_totals (
+        header_id TEXT PRIMARY KEY NOT NULL,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        lines INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS daily_item_totals (
+        day TEXT NOT NULL,
+        item_id TEXT NOT NULL,
+        quantity INTEGER NOT NULL DEFAULT 0,
+        lines INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, item_id)
+    ) WITHOUT ROWID""",
+    # "How many of part X this week" reads one short range of this index
+    "CREATE INDEX IF NOT EXISTS idx_daily_item_totals_item ON daily_item_totals (item_id, day)",
+    """CREATE TABLE IF NOT EXISTS daily_totals (
+        day TEXT PRIMARY KEY NOT NULL,
+        slips INTEGER NOT NULL DEFAULT 0,
+        quantity INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID""",
+]
+
+
+def rebuild_statements(item_day):
+    """Statements recomputing every totals table, items counted on `item_day`."""
+    return [
+        "DELETE FROM item_totals",
+        "DELETE FROM header_totals",
+        "DELETE FROM daily_item_totals",
+        "DELETE FROM daily_totals",
+        """INSERT INTO item_totals (item_id, quantity, lines)
+            SELECT ifnull(item_id, ''), sum(ifnull(quantity, 0)), count(*) FROM packing_items GROUP BY ifnull(item_id, '')""",
+        """INSERT INTO header_totals (header_id, quantity, lines)
+            SELECT ifnull(header_id, ''), sum(ifnull(quantity, 0)), count(*) FROM packing_items GROUP BY ifnull(header_id, '')""",
+        f"""INSERT INTO daily_item_totals (day, item_id, quantity, lines)
+            SELECT day, item_id, sum(quantity), count(*) FROM (
+                SELECT {item_day} AS day, ifnull(i.item_id, '') AS item_id, ifnull(i.quantity, 0) AS quantity
+                FROM packing_items i
+            ) WHERE day IS NOT NULL GROUP BY day, item_id""",
+        f"""INSERT INTO daily_totals (day, slips, quantity)
+            SELECT {DAY.format('s')}, count(*), 0 FROM packing_slip s
+            WHERE {DAY.format('s')} IS NOT NULL GROUP BY {DAY.format('s')}""",
+        """UPDATE daily_totals SET quantity = ifnull(
+            (SELECT sum(d.quantity) FROM daily_item_totals d WHERE d.day = daily_totals.day), 0)""",
+    ]
+
+
+def day_of(time_of_packing):
+    """Python side of DAY: the YYYY-MM-DD a time_of_packing counts on."""
+    return None if time_of_packing is None else str(time_of_packing)[:10]
+
+
+class TotalsDelta:
+    """
+    Changes to the totals tables from one batch of saves, summed in
+    memory and applied with one executemany per table.
+    """
+
+    def __init__(self):
+        self.items = {}
+        self.headers = {}
+        self.daily_items = {}
+        self.daily = {}
+        self.removed = False
+
+    @staticmethod
+    def _add(totals, key, first, second):
+        old = totals.get(key, (0, 0))
+        totals[key] = (old[0] + first, old[1] + second)
+
+    def item(self, header_id, item_id, day, quantity, lines=1):
+        """Count `quantity` more of a part (and `lines` more rows) under a header on a day."""
+        item_id = "" if item_id is None else item_id
+        quantity = quantity or 0
+        self._add(self.items, item_id, quantity, lines)
+        self._add(self.headers, "" if header_id is None else header_id, quantity, lines)
+        self.day_item(day, item_id, quantity, lines)
+
+    def day_item(self, day, item_id, quantity, lines=1):
+        """Only the per-day tables, e.g. for items moving between days."""
+        if day is None:
+            return
+        self._add(self.daily_items, (day, "" if item_id is None else item_id), quantity or 0, lines)
+        self._add(self.daily, day, 0, quantity or 0)
+        self.removed = self.removed or lines < 0
+
+    def slip(self, day, count=1):
+        if day is not None:
+            self._add(self.daily, day, count, 0)
+            self.removed = self.removed or count < 0
+
+    def apply(self, conn):
+        conn.executemany(
+            """INSERT INTO item_totals (item_id, quantity, lines) VALUES (?, ?, ?)
+                ON CONFLICT (item_id) DO UPDATE SET quantity = quantity + excluded.quantity, lines = lines + excluded.lines""",
+            [(key, quantity, lines) for key, (quantity, lines) in self.items.items()],
+        )
+        conn.executemany(
+            """INSERT INTO header_totals (header_id, quantity, lines) VALUES (?, ?, ?)
+                ON CONFLICT (header_id) DO UPDATE SET quantity = quantity + excluded.quantity, lines = lines + excluded.lines""",
+            [(key, quantity, lines) for key, (quantity, lines) in self.headers.items()],
+        )
+        conn.executemany(
+            """INSERT INTO daily_item_totals (day, item_id, quantity, lines) VALUES (?, ?, ?, ?)
+                ON CONFLICT (day, item_id) DO UPDATE SET quantity = quantity + excluded.quantity, lines = lines + excluded.lines""",
+            [key + value for key, value in self.daily_items.items()],
+        )
+        conn.executemany(
+            """INSERT INTO daily_totals (day, slips, quantity) VALUES (?, ?, ?)
+                ON CONFLICT (day) DO UPDATE SET slips = slips + excluded.slips, quantity = quantity + excluded.quantity""",
+            [(key,) + value for key, value in self.daily.items()],
+        )
+        if self.removed:
+            # Only a re-saved header takes anything away; drop rows it emptied
+            conn.executemany(
+                "DELETE FROM daily_item_totals WHERE day = ? AND item_id = ? AND lines = 0", list(self.daily_items)
+            )
+            conn.executemany(
+                "DELETE FROM daily_totals WHERE day = ? AND slips = 0 AND quantity = 0", [(day,) for day in self.daily]
+            )
+
+
+TOTALS_TABLE_NAMES = ("item_totals", "header_totals", "daily_item_totals", "daily_totals")
+
+
+def _snapshot(conn):
+    return {table: sorted(conn.execute(f"SELECT * FROM {table}").fetchall()) for table in TOTALS_TABLE_NAMES}
+
+
+def rebuild_totals(conn, item_day, check=False):
+    """
+    Recompute every totals table from packing_items / packing_slip, with
+    items counted on `item_day` (the manager's TOTALS_ITEM_DAY).
+
+    With check=True nothing is changed; returns, per table, how many rows
+    differ between the stored totals and a fresh rebuild (all zero when
+    the save path has kept up).
+    """
+    conn.execute("SAVEPOINT rebuild_totals")
+    try:
+        before = _snapshot(conn) if check else None
+        for statement in rebuild_statements(item_day):
+            conn.execute(statement)
+        if not check:
+            conn.execute("RELEASE rebuild_totals")
+            logger.info("Rebuilt packed-quantity totals")
+            return None
+        after = _snapshot(conn)
+        return {table: len(set(before[table]) ^ set(after[table])) for table in TOTALS_TABLE_NAMES}
+    finally:
+        if check:
+            conn.execute("ROLLBACK TO rebuild_totals")
+            conn.execute("RELEASE rebuild_totals")
+
+
+def main(argv=None):
+    import argparse
+    import importlib
+
+    parser = argparse.ArgumentParser(description="Rebuild or verify the packed-quantity totals tables")
+    parser.add_argument("--db", choices=["db_manager", "db_manager1"], default="db_manager")
+    parser.add_argument("--check", action="store_true", help="only report rows that differ from a rebuild")
+    args = parser.parse_args(argv)
+
+    manager = importlib.import_module(f"database.{args.db}")
+    manager.create_tables()
+    with manager.pool.transaction() as conn:
+        result = rebuild_totals(conn, manager.TOTALS_ITEM_DAY, check=args.check)
+    if args.check:
+        print(", ".join(f"{table}: {count} rows differ" for table, count in result.items()))
+    else:
+        print(f"Rebuilt totals for {manager.DB_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from modules import metrics
+
+logger = logging.getLogger(__name__)
+
+_FLUSH = object()
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """
+    Background writer that groups many records into one transaction.
+
+    submit() returns a Future that resolves once the record's transaction
+    has committed, so callers get a durable acknowledgement without
+    waiting on the commit themselves. A batch is written when it reaches
+    max_batch records or when flush_interval seconds have passed since
+    its first record. At most max_pending records wait in memory; beyond
+    that submit() blocks, pushing back on the producer.
+
+    write_batch(records) must write all records in a single transaction.
+    """
+
+    def __init__(self, write_batch, max_batch=200, flush_interval=0.25, max_pending=2000, name="db-writer"):
+        self.write_batch = write_batch
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        # The batch being gathered and a flush() waiting on it
+        self._batch = []
+        self._waiter = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, record, timeout=None):
+        """Queue one record; raises queue.Full if the buffer stays full past timeout."""
+        if self._closed:
+            raise RuntimeError("Writer is closed")
+        future = Future()
+        self._queue.put((record, future), timeout=timeout)
+        return future
+
+    def flush(self, timeout=None):
+        """Write everything submitted so far and wait for it to commit."""
+        done = Future()
+        self._queue.put((_FLUSH, done))
+        done.result(timeout)
+
+    def close(self, timeout=30):
+        """Flush pending records and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put((_STOP, None))
+        self._thread.join(timeout)
+
+    def _write(self, batch):
+        if not batch:
+            return
+        records = [record for record, _ in batch]
+        metrics.inc("db_write_batches")
+        metrics.inc("db_write_records", len(records))
+        try:
+            with metrics.timer("db_write_batch_seconds"):
+                self.write_batch(records)
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error(f"Write failed: {str(e)}")
+                batch[0][1].set_exception(e)
+                return
+            # One bad record must not sink the rest: retry them one by one
+            logger.warning(f"Batch of {len(batch)} failed ({str(e)}); retrying individually")
+            for entry in batch:
+                self._write([entry])
+            return
+        for _, future in batch:
+            future.set_result(True)
+
+    def _run(self):
+        # Whatever goes wrong with one batch, later saves must still be written
+        while True:
+            try:
+                self._loop()
+                return
+            except Exception as e:
+                logger.exception("Writer loop failed; continuing")
+                # Nobody else will resolve the saves that were in flight (or a
+                # flush waiting on them), so fail them rather than hang callers
+                for future in [future for _, future in self._batch] + [self._waiter]:
+                    if future is not None and not future.done():
+                        future.set_exception(e)
+                self._batch, self._waiter = [], None
+
+    def _write_batch(self):
+        # Cleared only once written; if _write raises, _run fails what is left
+        self._write(self._batch)
+        self._batch = []
+
+    def _loop(self):
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                record, future = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._write_batch()
+                deadline = None
+                continue
+
+            if record is _FLUSH or record is _STOP:
+                self._waiter = future
+                self._write_batch()
+                self._waiter, deadline = None, None
+                if record is _STOP:
+                    return
+                future.set_result(True)
+                continue
+
+            # A caller may have cancelled while the record was queued; once
+            # marked running the Future can no longer be cancelled
+            if not future.set_running_or_notify_cancel():
+                metrics.inc("db_write_cancelled")
+                continue
+            self._batch.append((record, future))
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            if len(self._batch) >= self.max_batch:
+                self._write_batch()
+                deadline = None
@@ -0,0 +1,338 @@
+"""
+Headless ingest service for dock cameras and handheld terminals.
+
+    python ingest.py --port 8600 --manager db_manager
+
+Runs alongside the Streamlit apps against the same database. Endpoints
+(JSON responses):
+
+    POST /scan?profile=item    raw image bytes -> {"code": ..., "found": ...}
+    POST /slips                a packing slip as JSON, items given as
+                               decoded codes and/or base64 photos -> 201
+    GET  /health               queue depths
+    GET  /metrics              Prometheus text for this process
+
+A slip looks like {"header_id": "...", "customer_name": "...",
+"location": "...", "time_of_packing": "...", "items": [{"item_id": "..."},
+{"image": "<base64>", "quantity": 2}]}; "header_image" may replace
+"header_id". It is acknowledged only once committed.
+
+Decoding runs on the shared worker pool from modules.batch, fed from a
+bounded queue; slips go through the manager's write-behind queue, which
+groups concurrent slips into one transaction. When either is full the
+request is refused with 503 and Retry-After instead of queueing without
+bound.
+"""
+import argparse
+import asyncio
+import base64
+import binascii
+import datetime
+import importlib
+import json
+import logging
+import os
+import queue
+import signal
+import time
+from functools import partial
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from modules import metrics
+from modules.batch import get_pool
+from modules.engine import decode_barcode_from_bytes, get_engine
+from modules.symbology import PROFILES
+
+logger = logging.getLogger("ingest")
+
+INGEST_PORT = int(os.environ.get("INGEST_PORT", "8600"))
+# Images waiting for a decode worker before new ones get 503
+DECODE_QUEUE_SIZE = int(os.environ.get("INGEST_DECODE_QUEUE", "64"))
+# Seconds one image may take, queue wait included
+DECODE_TIMEOUT = 10.0
+MAX_BODY = 20 * 1024 * 1024
+ROUTES = ("/scan", "/slips", "/health", "/metrics")
+
+
+class IngestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _warm_worker(_):
+    """Load the decoder in a pool worker before traffic arrives."""
+    get_engine()
+    return os.getpid()
+
+
+def _json_body(body):
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise IngestError(400, "body is not valid JSON") from None
+    if not isinstance(data, dict):
+        raise IngestError(400, "expected a JSON object")
+    return data
+
+
+def _b64(value, field):
+    try:
+        return base64.b64decode(value, validate=True)
+    except (binascii.Error, TypeError):
+        raise IngestError(400, f"{field} is not valid base64") from None
+
+
+class IngestService:
+    """Request handling, the decode queue and its workers, for one event loop."""
+
+    def __init__(self, manager, executor, workers, queue_size=DECODE_QUEUE_SIZE, decode_timeout=DECODE_TIMEOUT):
+        self.manager = manager
+        self.executor = executor
+        self.workers = workers
+        self.decode_timeout = decode_timeout
+        self._decode_queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks = []
+        metrics.registry.gauge("ingest_decode_queue", self._decode_queue.qsize)
+
+    def start(self):
+        # A couple of jobs per worker in flight keeps the pool busy
+        # while results travel back
+        self._tasks = [asyncio.create_task(self._decode_worker()) for _ in range(2 * self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _decode_worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            image_bytes, profile, future = await self._decode_queue.get()
+            try:
+                # Skip images whose client already gave up
+                if not future.done():
+                    code = await loop.run_in_executor(
+                        self.executor, partial(decode_barcode_from_bytes, profile=profile), image_bytes
+                    )
+                    if not future.done():
+                        future.set_result(code)
+            except Exception as e:
+                logger.error(f"Decode failed: {str(e)}")
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self._decode_queue.task_done()
+
+    async def decode(self, image_bytes, profile):
+        """Queue one image; raises IngestError(503) at once if the queue is full."""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._decode_queue.put_nowait((image_bytes, profile, future))
+        except asyncio.QueueFull:
+            metrics.inc("ingest_rejected", reason="decode_queue")
+            raise IngestError(503, "decode queue full") from None
+        try:
+            return await asyncio.wait_for(future, self.decode_timeout)
+        except asyncio.TimeoutError:
+            raise IngestError(504, "decode timed out") from None
+
+    async def scan(self, query, body):
+        profile = query.get("profile", ["item"])[0]
+        if profile not in PROFILES:
+            raise IngestError(400, f"unknown profile {profile!r}")
+        if not body:
+            raise IngestError(400, "empty image")
+        started = time.perf_counter()
+        code = await self.decode(body, profile)
+        return 200, {"code": code, "found": code is not None,
+                     "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    async def _item(self, item, index):
+        if not isinstance(item, dict):
+            raise IngestError(400, f"item {index} is not an object")
+        image = _b64(item["image"], f"items[{index}].image") if item.get("image") else None
+        try:
+            quantity = int(item.get("quantity", 1))
+        except (TypeError, ValueError):
+            raise IngestError(400, f"items[{index}].quantity must be a number") from None
+        if quantity <= 0:
+            raise IngestError(400, f"items[{index}].quantity must be positive")
+        item_id = item.get("item_id")
+        if not item_id and image is not None:
+            item_id = await self.decode(image, "item")
+        return {
+            "item_id": item_id,
+            "description": item.get("description", ""),
+            "quantity": quantity,
+            "image": image,
+        }
+
+    async def slip(self, body):
+        slip = _json_body(body)
+        header_id = slip.get("header_id")
+        if not header_id and slip.get("header_image"):
+            header_id = await self.decode(_b64(slip["header_image"], "header_image"), "header")
+        if not header_id:
+            raise IngestError(422, "no header_id and no readable header_image")
+        items = slip.get("items")
+        if not items or not isinstance(items, list):
+            raise IngestError(400, "items must be a non-empty list")
+        items = await asyncio.gather(*(self._item(item, index) for index, item in enumerate(items)))
+        unreadable = [index for index, item in enumerate(items) if not item["item_id"]]
+        if unreadable:
+            return 422, {"error": "no barcode found", "unreadable_items": unreadable}
+
+        header_info = {
+            "header_id": header_id,
+            "customer_name": slip.get("customer_name", ""),
+            "location": slip.get("location", ""),
+            "time_of_packing": slip.get("time_of_packing") or datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        loop = asyncio.get_running_loop()
+        try:
+            # Photos are written to the image store here, so off the loop
+            committed = await loop.run_in_executor(
+                None, partial(self.manager.save_packing_slip_async, header_info, items, timeout=0)
+            )
+        except queue.Full:
+            metrics.inc("ingest_rejected", reason="db_writer")
+            raise IngestError(503, "database writer busy") from None
+        await asyncio.wrap_future(committed)
+        return 201, {"header_id": header_id,
+                     "items": [{"item_id": i["item_id"], "quantity": i["quantity"]} for i in items]}
+
+    def health(self):
+        return 200, {"decode_queue": self._decode_queue.qsize(), "decode_queue_max": self._decode_queue.maxsize,
+                     "workers": self.workers}
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        route = (method, url.path)
+        if route == ("POST", "/scan"):
+            return await self.scan(parse_qs(url.query), body)
+        if route == ("POST", "/slips"):
+            return await self.slip(body)
+        if route == ("GET", "/health"):
+            return self.health()
+        if route == ("GET", "/metrics"):
+            return 200, metrics.registry.render_prometheus()
+        if url.path in ROUTES:
+            raise IngestError(405, f"{method} not allowed on {url.path}")
+        raise IngestError(404, f"no route {url.path}")
+
+    async def handle_connection(self, reader, writer):
+        """HTTP/1.1 with keep-alive: one request at a time per connection."""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    method, target, version = line.decode("latin-1").split()
+                except ValueError:
+                    writer.write(_response(400, {"error": "bad request line"}, False))
+                    break
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = header.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    # Where this body ends is unknown, so the connection cannot be reused
+                    writer.write(_response(400, {"error": "bad Content-Length"}, False))
+                    break
+                if length > MAX_BODY:
+                    # The body is not read, so the connection cannot be reused
+                    writer.write(_response(413, {"error": f"body over {MAX_BODY} bytes"}, False))
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                started = time.perf_counter()
+                try:
+                    status, payload = await self.dispatch(method, target, body)
+                except IngestError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except Exception as e:
+                    logger.exception("Request failed")
+                    status, payload = 500, {"error": str(e)}
+                # Unknown paths share one label so scanners cannot grow the series
+                path = urlsplit(target).path
+                path = path if path in ROUTES else "other"
+                metrics.observe("ingest_request_seconds", time.perf_counter() - started, route=path)
+                metrics.inc("ingest_requests", route=path, status=status)
+                writer.write(_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def _response(status, payload, keep_alive):
+    if isinstance(payload, str):
+        body, content_type = payload.encode(), "text/plain; version=0.0.4"
+    else:
+        body, content_type = json.dumps(payload).encode(), "application/json"
+    head = [
+        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+        f"Content-Type: {content_type}",
+        f"Content-Length: {len(body)}",
+        "Connection: keep-alive" if keep_alive else "Connection: close",
+    ]
+    if status == 503:
+        head.append("Retry-After: 1")
+    return ("\r\n".join(head) + "\r\n\r\n").encode() + body
+
+
+async def serve(manager, executor, workers, host="0.0.0.0", port=INGEST_PORT, queue_size=DECODE_QUEUE_SIZE):
+    """Run the service until SIGINT/SIGTERM, then commit queued slips and exit."""
+    service = IngestService(manager, executor, workers, queue_size)
+    service.start()
+    server = await asyncio.start_server(service.handle_connection, host, port, backlog=1024)
+    logger.info(f"Ingest service on {host}:{port} with {workers} decode workers")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    async with server:
+        await stop.wait()
+    await service.stop()
+    await loop.run_in_executor(None, manager.flush_writes)
+    logger.info("Ingest service stopped")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless barcode and packing-slip ingest service")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=INGEST_PORT)
+    parser.add_argument("--manager", choices=["db_manager", "db_manager1"], default="db_manager",
+                        help="database the slips go to: main.py's or main1.py's")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--pool", choices=["process", "thread"], default="process")
+    parser.add_argument("--queue", type=int, default=DECODE_QUEUE_SIZE, help="decode queue size")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    manager = importlib.import_module(f"database.{args.manager}")
+    manager.create_tables()
+    # Start the decode workers and load their decoders before traffic arrives
+    executor = get_pool(args.pool, args.workers)
+    list(executor.map(_warm_worker, range(args.workers)))
+    asyncio.run(serve(manager, executor, args.workers, args.host, args.port, args.queue))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,38 @@
 import streamlit as st
-import io
-import zipfile
-import pandas as pd
+import os
 import datetime
-from modules.Scanner import decode_barcode_from_bytes, RealTimeBarcodeScanner
-from database.db_manager import create_tables, save_packing_slip, create_connection
+import logging
+from collections import Counter
+# OpenCV, pyzbar, pandas and pyarrow load on first use inside these modules,
+# so a session that only types details never pays for them
+from modules.engine import decode_barcode_from_bytes, decode_many
+from database.db_manager import create_tables, save_packing_slip, pool as db_pool, image_store as db_image_store
+from modules.bom import check_items, describe_part
+from database.export import export_zip_file, export_parquet_zip_file, ExportFilter, advance_cursor, cursor_name
+from modules.metrics import serve_from_env
+from modules.capture import compact_camera_input, compact_file_uploader
+from modules.cart import Cart, CartItem
 
 st.set_page_config(page_title="Barcode Scanner", page_icon="🔍")
 
 # ---------- Initialize ----------
-create_tables()
+@st.cache_resource
+def startup():
+    """Once per server process, not per session or rerun."""
+    logging.basicConfig(level=logging.INFO)
+    create_tables()
+    serve_from_env()
+
+startup()
 
 # Session state variables
-if "header" not in st.session_state:
-    st.session_state["header"] = None
-if "items" not in st.session_state:
-    st.session_state["items"] = []
-if "captured_image" not in st.session_state:
-    st.session_state["captured_image"] = None
+# Header, items and photos of the slip being packed; photos are held by
+# content hash under a per-session memory budget
+if "cart" not in st.session_state:
+    st.session_state["cart"] = Cart()
+if "batch_seen" not in st.session_state:
+    st.session_state["batch_seen"] = set()
+cart = st.session_state["cart"]
 
 st.title("📦 Barcode Scanner App")
 
@@ -26,41 +41,76 @@ st.header("Step 1: Scan Item Barcodes")
 n = st.number_input("Enter number of items to scan (excluding header):", min_value=1, step=1)
 
 for i in range(n):
-    if i >= len(st.session_state["items"]):
-        st.session_state["items"].append(None)
+    if i >= len(cart.items):
+        cart.items.append(None)
     with st.expander(f"Scan Item {i + 1}"):
-        image = st.camera_input(f"Take photo of Item {i + 1}")
+        # Resized and cropped to the aim box on the phone before upload;
+        # keyed by cart so a saved slip leaves fresh inputs behind
+        image = compact_camera_input(f"Take photo of Item {i + 1}", key=f"item_photo_{i}_{cart.id}", crop_to_guide=True)
         if image:
-            barcode = decode_barcode_from_bytes(image.getvalue())
+            barcode = decode_barcode_from_bytes(image.getvalue(), profile="item")
             if barcode:
-                st.session_state["items"][i] = {
-                    "item_id": barcode,
-                    "description": "",
-                    "quantity": 1,
-                    "image": None
-                }
+                # The photo stays in the widget, so reruns decode it again
+                if cart.items[i] is None or cart.items[i].item_id != barcode:
+                    cart.items[i] = CartItem(barcode)
                 st.success(f"✅ Scanned Item {i + 1}: {barcode}")
             else:
                 st.warning("No barcode detected. Try again.")
 
+# ---------- Bulk Upload ----------
+with st.expander("Bulk upload item photos"):
+    uploads = compact_file_uploader("Upload item photos", multiple=True)
+    # Reruns keep the same files in the uploader, so only decode new ones
+    new_uploads = [f for f in uploads or [] if f.file_id not in st.session_state["batch_seen"]]
+    if new_uploads:
+        progress = st.progress(0.0)
+        for done, result in enumerate(decode_many([f.getvalue() for f in new_uploads], timeout=10, profile="item"), start=1):
+            upload = new_uploads[result.index]
+            st.session_state["batch_seen"].add(upload.file_id)
+            if result.value:
+                cart.items.append(CartItem(result.value))
+                st.success(f"✅ {upload.name}: {result.value}")
+            else:
+                st.warning(f"No barcode detected in {upload.name}.")
+            progress.progress(done / len(new_uploads))
+
+# ---------- Whole Crate Photo ----------
+with st.expander("Scan a whole crate in one photo"):
+    # Many small labels in one frame: keep more pixels than a single-label shot
+    crate_img = compact_camera_input("Take one photo showing the header and every item label", key=f"crate_photo_{cart.id}", max_side=2560)
+    if crate_img:
+        from modules.Scanner import decode_all_from_bytes, split_header
+        symbols = decode_all_from_bytes(crate_img.getvalue())
+        crate_header, crate_items = split_header(symbols)
+        if symbols:
+            st.table([{"Code": sym.data, "Type": sym.type, "Header": sym.is_header} for sym in symbols])
+            if st.button("Use these codes"):
+                if crate_header:
+                    cart.header = crate_header
+                # Same code on several labels means several units of that item
+                cart.items = [CartItem(code, quantity=count) for code, count in Counter(crate_items).items()]
+                st.success(f"✅ Header {crate_header or '-'} and {len(crate_items)} item labels captured")
+        else:
+            st.warning("No barcodes detected. Try again.")
+
 # ---------- Step 2: Header Barcode ----------
 st.header("Step 2: Scan Header Barcode")
-header_img = st.camera_input("Scan Header Barcode")
+header_img = compact_camera_input("Scan Header Barcode", key=f"header_photo_{cart.id}")
 
 if header_img:
-    header_code = decode_barcode_from_bytes(header_img.getvalue())
+    header_code = decode_barcode_from_bytes(header_img.getvalue(), profile="header")
     if header_code:
-        st.session_state["header"] = header_code
+        cart.header = header_code
         st.success(f"✅ Scanned Header: {header_code}")
     else:
         st.warning("No barcode detected in header. Try again.")
 
 # ---------- Final Results ----------
 st.header("📋 Final Scanned Results")
-if all(item is not None for item in st.session_state["items"]) and st.session_state["header"]:
-    for idx, item in enumerate(st.session_state["items"], start=1):
-        st.write(f"Item {idx}: {item['item_id']}")
-    st.write(f"Header: {st.session_state['header']}")
+if all(item is not None for item in cart.items) and cart.header:
+    for idx, item in enumerate(cart.items, start=1):
+        st.write(f"Item {idx}: {item.item_id}")
+    st.write(f"Header: {cart.header}")
 else:
     st.info("Scan all items and the header to see final results.")
 
@@ -75,72 +125,102 @@ st.write(f"Time of Packing: {time_of_packing}")
 # ---------- Add More Items via Real-time Scanner ----------
 st.header("📦 Add More Items via Real-Time Scanner")
 if st.button("Scan Item Barcode"):
-    scanned_item = RealTimeBarcodeScanner()
+    from modules.Scanner import RealTimeBarcodeScanner
+    with RealTimeBarcodeScanner() as scanner:
+        scanned_item = scanner.scan()
     if scanned_item:
-        st.session_state["items"].append({
-            "item_id": scanned_item,
-            "description": "",
-            "quantity": 1,
-            "image": None
-        })
+        cart.items.append(CartItem(scanned_item))
         st.success(f"Item scanned: {scanned_item}")
     else:
         st.error("Item scan failed!")
 
 # ---------- Enter Details for Items ----------
-if st.session_state["items"]:
+if cart.items:
     st.subheader("📝 Item Details")
-    for idx, item in enumerate(st.session_state["items"], start=1):
+    for idx, item in enumerate(cart.items, start=1):
         if item is None:
             st.warning(f"Item {idx} has not been scanned yet.")
             continue
-        st.write(f"**Item {idx}: Barcode - {item['item_id']}**")
+        st.write(f"**Item {idx}: Barcode - {item.item_id}**")
         col1, col2 = st.columns(2)
         with col1:
-            desc = st.text_input(f"Description for Item {idx}", value=item.get("description", ""), key=f"desc_{idx}")
+            # Pre-fill from the engineering BOM when the part is known
+            default_desc = item.description or describe_part(item.item_id) or ""
+            item.description = st.text_input(f"Description for Item {idx}", value=default_desc, key=f"desc_{idx}_{cart.id}")
         with col2:
-            qty = st.number_input(f"Quantity for Item {idx}", min_value=1, value=item.get("quantity", 1), key=f"qty_{idx}")
-        st.session_state["items"][idx - 1]["description"] = desc
-        st.session_state["items"][idx - 1]["quantity"] = qty
+            item.quantity = st.number_input(f"Quantity for Item {idx}", min_value=1, value=item.quantity, key=f"qty_{idx}_{cart.id}")
 
 # ---------- Capture Image for Items ----------
 st.header("📷 Capture Image for Items")
 if st.button("Start Capture Image"):
-    img_file = st.camera_input("Take a picture of an item")
+    img_file = compact_camera_input("Take a picture of an item")
     if img_file:
-        st.image(img_file, caption="Captured Image", use_container_width=True)
-        st.session_state["captured_image"] = img_file.getvalue()
+        st.image(img_file.getvalue(), caption="Captured Image", use_container_width=True)
+        # Used for every item without a photo of its own
+        cart.default_image = cart.put_image(img_file.getvalue())
+
+# ---------- BOM Check ----------
+bom, bom_check = check_items(cart.header, cart.items)
+bom_ok = True
+if bom_check:
+    st.header("🧾 BOM Check")
+    if bom_check.extra:
+        st.error(f"Not in BOM {bom.root_part}: {', '.join(bom_check.extra)}")
+    for part, (scanned, expected) in bom_check.over.items():
+        st.error(f"{part}: {scanned} scanned, BOM expects {expected}")
+    if bom_check.missing:
+        st.warning(f"Not scanned yet: {', '.join(bom_check.missing)}")
+    if bom_check.extra or bom_check.over:
+        bom_ok = st.checkbox("Save despite BOM mismatches")
+    else:
+        st.success("All scanned parts match the BOM.")
 
 # ---------- Save Packing Slip ----------
-if st.button("Save Packing Slip"):
-    if st.session_state["captured_image"]:
-        for item in st.session_state["items"]:
-            if item["image"] is None:
-                item["image"] = st.session_state["captured_image"]
+if st.button("Save Packing Slip", disabled=not bom_ok):
     header_info = {
-        "header_id": st.session_state["header"],
+        "header_id": cart.header,
         "customer_name": customer_name,
         "location": location,
         "time_of_packing": time_of_packing
     }
-    item_list = st.session_state["items"]
+    item_list = cart.slip_items(db_image_store)
     save_packing_slip(header_info, item_list)
+    # Free this slip's photos and start the next one with empty inputs
+    cart.close()
+    st.session_state["cart"] = Cart()
     st.success("Packing slip saved successfully!")
 
 # ---------- Export to CSV ----------
-def export_data():
-    conn = create_connection()
-    df_slips = pd.read_sql_query("SELECT * FROM packing_slip", conn)
-    df_items = pd.read_sql_query("SELECT * FROM packing_items", conn)
-    conn.close()
-    return df_slips, df_items
-
 st.header("⬇️ Download Database")
+with st.expander("Export options"):
+    export_customer = st.text_input("Only customer (optional)", key="export_customer")
+    export_dates = st.date_input("Packed between (optional)", value=[], key="export_dates")
+    export_incremental = st.checkbox("Only rows added since the last incremental export")
+    export_images = st.checkbox("Include item photos")
+    export_format = st.radio("Format", ["CSV", "Parquet (partitioned by date)"], horizontal=True)
+
 if st.button("Download Data"):
-    df_slips, df_items = export_data()
-    with io.BytesIO() as buffer:
-        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
-            zip_file.writestr("packing_slip.csv", df_slips.to_csv(index=False))
-            zip_file.writestr("packing_items.csv", df_items.to_csv(index=False))
-        buffer.seek(0)
-        st.download_button("Download Database CSV", data=buffer, file_name="database_data.zip", mime="application/zip")
+    filters = ExportFilter(
+        start=str(export_dates[0]) if len(export_dates) > 0 else None,
+        end=str(export_dates[1] + datetime.timedelta(days=1)) if len(export_dates) > 1 else None,
+        customer=export_customer or None,
+    )
+    # Rows stream from SQLite into a ZIP on disk, never a DataFrame in memory
+    if export_format == "CSV":
+        incremental = "main" if export_incremental else None
+        path, cursor = export_zip_file(
+            db_pool, filters,
+            incremental=incremental,
+            image_store=db_image_store if export_images else None,
+        )
+    else:
+        incremental = "main_parquet" if export_incremental else None
+        path, cursor = export_parquet_zip_file(db_pool, filters, incremental=incremental)
+    with open(path, "rb") as f:
+        # The incremental cursor only moves once the file is actually downloaded
+        st.download_button(
+            "Download Database Export", data=f, file_name="database_data.zip", mime="application/zip",
+            on_click=advance_cursor if incremental else None,
+            args=(db_pool, cursor_name(incremental, filters), cursor) if incremental else None,
+        )
+    os.remove(path)
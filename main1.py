@@ -1,69 +1,97 @@
 import streamlit as st
-import io
-import zipfile
-import pandas as pd
 import datetime
+import logging
 import os
-from modules.scanner1 import decode_barcode_from_bytes
-from database.db_manager1 import create_tables, save_packing_slip
+from modules.engine import decode_barcode_from_bytes, decode_many, set_default_strategy
+from database.db_manager1 import create_tables, save_packing_slip, pool as db_pool, image_store as db_image_store
+from modules.bom import check_items, describe_part
+from database.export import export_zip_file, export_parquet_zip_file, ExportFilter, advance_cursor, cursor_name
+from modules.metrics import serve_from_env
+from modules.capture import compact_camera_input, compact_file_uploader
+from modules.cart import Cart, CartItem
+
+# UI Configuration; must be the first Streamlit call of the script
+st.set_page_config(page_title="FLS Bawal Inventory", page_icon="🔍")
 
 # Initialize session state properly
 class SessionState:
     def __init__(self):
-        self.header = None
-        self.items = []
+        # Header, items and photos (by content hash, memory-bounded) of the current slip
+        self.cart = Cart()
+        self.batch_seen = set()
 
 if 'app_state' not in st.session_state:
     st.session_state.app_state = SessionState()
+cart = st.session_state.app_state.cart
 
-# Initialize database
-create_tables()
+# Initialize database, logging and the metrics endpoint once per server process
+@st.cache_resource
+def startup():
+    logging.basicConfig(level=logging.INFO)
+    # This app has always decoded with PIL + zbar (scanner1); SCANNER_STRATEGY overrides
+    set_default_strategy("pil")
+    create_tables()
+    serve_from_env()
+
+startup()
 
-# UI Configuration
-st.set_page_config(page_title="FLS Bawal Inventory", page_icon="🔍")
 st.title("📦 FLS Packing Tracker")
 
 # Helper function for image input
 def get_image_input(label):
+    # Keyed by cart so a saved slip leaves fresh inputs behind
     option = st.radio(f"{label} - Input Method:", 
                      ["Camera", "Upload"], 
                      horizontal=True,
-                     key=f"input_{label}")
+                     key=f"input_{label}_{cart.id}")
+    # Both paths resize and recompress on the device before upload
     if option == "Camera":
-        return st.camera_input(label)
-    return st.file_uploader(label, type=['jpg', 'png', 'jpeg'])
+        return compact_camera_input(label, key=f"{label}_{cart.id}")
+    return compact_file_uploader(label, key=f"{label}_upload_{cart.id}")
 
 # Step 1: Scan Item Barcodes
 st.header("Step 1: Scan Items")
 num_items = st.number_input("Number of items to scan:", min_value=1, value=1, step=1)
 
 # Ensure items list is properly sized
-while len(st.session_state.app_state.items) < num_items:
-    st.session_state.app_state.items.append(None)
+while len(cart.items) < num_items:
+    cart.items.append(None)
 
 for i in range(num_items):
     with st.expander(f"Item {i+1}", expanded=True):
         image = get_image_input(f"Scan Item {i+1}")
         if image:
-            barcode = decode_barcode_from_bytes(image.getvalue())
+            barcode = decode_barcode_from_bytes(image.getvalue(), profile="item")
             if barcode:
-                st.session_state.app_state.items[i] = {
-                    "item_id": barcode,
-                    "description": "",
-                    "quantity": 1,
-                    "image": None
-                }
+                # Reruns decode the same photo again; keep the item (and its image) if unchanged
+                if cart.items[i] is None or cart.items[i].item_id != barcode:
+                    cart.items[i] = CartItem(barcode)
                 st.success(f"✅ Scanned Item {i+1}: {barcode}")
             else:
                 st.warning("No barcode detected. Try again.")
 
+# Batch upload: many item photos at once, decoded in parallel
+with st.expander("Batch Upload"):
+    uploads = compact_file_uploader("Upload item photos", key="batch_upload", multiple=True)
+    new_uploads = [f for f in uploads or [] if f.file_id not in st.session_state.app_state.batch_seen]
+    # Nothing new means no decoder (or OpenCV and zbar) to load on this rerun
+    if new_uploads:
+        for result in decode_many([f.getvalue() for f in new_uploads], timeout=10, profile="item"):
+            upload = new_uploads[result.index]
+            st.session_state.app_state.batch_seen.add(upload.file_id)
+            if result.value:
+                cart.items.append(CartItem(result.value))
+                st.success(f"✅ {upload.name}: {result.value}")
+            else:
+                st.warning(f"No barcode detected in {upload.name}")
+
 # Step 2: Header Barcode
 st.header("Step 2: Scan Header")
 header_img = get_image_input("Scan Header Barcode")
 if header_img:
-    header_code = decode_barcode_from_bytes(header_img.getvalue())
+    header_code = decode_barcode_from_bytes(header_img.getvalue(), profile="header")
     if header_code:
-        st.session_state.app_state.header = header_code
+        cart.header = header_code
         st.success(f"✅ Scanned Header: {header_code}")
     else:
         st.warning("No barcode detected in header. Try again.")
@@ -75,79 +103,102 @@ location = st.text_input("Location")
 time_of_packing = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
 # Item Management
-if any(st.session_state.app_state.items):
+if any(cart.items):
     st.header("📝 Item Details")
-    for idx, item in enumerate(st.session_state.app_state.items.copy(), 1):
+    for idx, item in enumerate(cart.items.copy(), 1):
         if item is None:
             continue
             
         cols = st.columns([4, 1])
         with cols[0]:
-            st.subheader(f"Item {idx}: {item['item_id']}")
-            item["description"] = st.text_input(
+            st.subheader(f"Item {idx}: {item.item_id}")
+            item.description = st.text_input(
                 "Description", 
-                value=item.get("description", ""),
-                key=f"desc_{idx}"
+                value=item.description or describe_part(item.item_id) or "",
+                key=f"desc_{idx}_{cart.id}"
             )
-            item["quantity"] = st.number_input(
+            item.quantity = st.number_input(
                 "Quantity",
                 min_value=1,
-                value=item.get("quantity", 1),
-                key=f"qty_{idx}"
+                value=item.quantity,
+                key=f"qty_{idx}_{cart.id}"
             )
             
-            if st.button(f"📷 Capture Image", key=f"img_btn_{idx}"):
+            if st.button(f"📷 Capture Image", key=f"img_btn_{idx}_{cart.id}"):
                 img = get_image_input(f"Capture Item {idx} Image")
                 if img:
-                    item["image"] = img.getvalue()
+                    cart.set_image(item, img.getvalue())
         
         with cols[1]:
-            if st.button("❌", key=f"del_{idx}"):
-                st.session_state.app_state.items.pop(idx-1)
+            if st.button("❌", key=f"del_{idx}_{cart.id}"):
+                cart.remove(idx-1)
                 st.rerun()
 
 # Save Functionality
 st.header("Save Data")
+bom, bom_check = check_items(cart.header, cart.items)
+bom_override = False
+if bom_check:
+    if bom_check.extra:
+        st.error(f"Not in BOM {bom.root_part}: {', '.join(bom_check.extra)}")
+    for part, (scanned, expected) in bom_check.over.items():
+        st.error(f"{part}: scanned {scanned}, BOM expects {expected}")
+    if bom_check.missing:
+        st.warning(f"Missing from BOM {bom.root_part}: {', '.join(bom_check.missing)}")
+    if bom_check.extra or bom_check.over:
+        bom_override = st.checkbox("Save despite BOM mismatches")
 if st.button("💾 Save Packing Slip"):
-    if not st.session_state.app_state.header:
+    if not cart.header:
         st.error("Please scan header barcode")
-    elif not any(item for item in st.session_state.app_state.items if item):
+    elif not any(item for item in cart.items if item):
         st.error("Please scan at least one valid item")
     elif not customer_name:
         st.error("Please enter customer name")
+    elif bom_check and (bom_check.extra or bom_check.over) and not bom_override:
+        st.error("Scanned items do not match the BOM; confirm to save anyway")
     else:
         save_packing_slip(
             {
-                "header_id": st.session_state.app_state.header,
+                "header_id": cart.header,
                 "customer_name": customer_name,
                 "location": location,
                 "time_of_packing": time_of_packing
             },
-            [item for item in st.session_state.app_state.items if item]
+            cart.slip_items(db_image_store)
         )
+        # Free this slip's photos and start the next one with empty inputs
+        cart.close()
+        st.session_state.app_state.cart = Cart()
         st.success("Packing slip saved successfully!")
 
 # Export Functionality
-@st.cache_data
-def export_data():
-    import database.db_manager1 as db
-    conn = db.create_connection()
-    df_slips = pd.read_sql("SELECT * FROM packing_slip", conn)
-    df_items = pd.read_sql("SELECT * FROM packing_items", conn)
-    conn.close()
-    return df_slips, df_items
+with st.expander("Export Filters"):
+    export_customer = st.text_input("Customer", key="export_customer")
+    export_dates = st.date_input("Packing dates", value=[], key="export_dates")
+    export_incremental = st.checkbox("Only new since last export")
+    export_parquet = st.checkbox("Parquet for analytics (partitioned by packing date)")
 
 if st.button("📤 Export Data"):
-    df_slips, df_items = export_data()
-    
-    with io.BytesIO() as buffer:
-        with zipfile.ZipFile(buffer, 'w') as zip_file:
-            zip_file.writestr('packing_slips.csv', df_slips.to_csv(index=False))
-            zip_file.writestr('packing_items.csv', df_items.to_csv(index=False))
-        buffer.seek(0)
+    filters = ExportFilter(
+        start=str(export_dates[0]) if len(export_dates) > 0 else None,
+        end=str(export_dates[1] + datetime.timedelta(days=1)) if len(export_dates) > 1 else None,
+        customer=export_customer or None,
+    )
+    # Streams rows batch by batch into a temp ZIP; images stay in the image store
+    if export_parquet:
+        incremental = "main1_parquet" if export_incremental else None
+        path, cursor = export_parquet_zip_file(db_pool, filters, incremental=incremental)
+    else:
+        incremental = "main1" if export_incremental else None
+        path, cursor = export_zip_file(db_pool, filters, incremental=incremental)
+    with open(path, "rb") as f:
+        # The incremental cursor only moves once the file is actually downloaded
         st.download_button(
             "Download Data as ZIP",
-            data=buffer,
+            data=f,
             file_name="packing_data.zip",
-            mime="application/zip"
-        )
\ No newline at end of file
+            mime="application/zip",
+            on_click=advance_cursor if incremental else None,
+            args=(db_pool, cursor_name(incremental, filters), cursor) if incremental else None
+        )
+    os.remove(path)
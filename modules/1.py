@@ -1,40 +1,53 @@
+import os
+import sys
 import cv2
-from pyzbar.pyzbar import decode, ZBarSymbol
+from pyzbar.pyzbar import ZBarSymbol
 import numpy as np
 import time  # <-- This was missing
 
+# Run as a script from modules/, so make the project root importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules import metrics
+from modules.localize import decode_regions, zbar_decode
+from modules.frame_pipeline import FramePipeline
+from modules.frame_quality import FrameGate
+from modules.camera_session import acquire_camera
+from modules.symbology import ean13_valid
+
 class EAN13Scanner:
-    def __init__(self, camera_index=0):
+    def __init__(self, camera_index=0, workers=2):
         """
         Initialize EAN-13 barcode scanner.
         
         Args:
             camera_index (int): Camera device index (default: 0)
+            workers (int): Number of decode threads (default: 2)
         """
         self.camera_index = camera_index
+        self.workers = workers
         self.cap = None
         self.last_barcode = None
         self.scanning = False
+        self.gate = None
 
     def start(self):
-        """Initialize camera with optimized settings for EAN-13 scanning."""
-        self.cap = cv2.VideoCapture(self.camera_index)
-        if not self.cap.isOpened():
-            raise RuntimeError("Failed to open camera!")
-        
-        # Optimized settings for EAN-13 scanning
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)  # Higher width helps with EAN-13
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-        self.cap.set(cv2.CAP_PROP_AUTOFOCUS, 0)  # Disable autofocus for stability
-        self.cap.set(cv2.CAP_PROP_FPS, 15)  # Lower FPS for better exposure
+        """Attach to the shared camera with optimized settings for EAN-13 scanning."""
+        self.cap = acquire_camera(
+            self.camera_index,
+            width=1280,  # Higher width helps with EAN-13
+            height=720,
+            autofocus=0,  # Disable autofocus for stability
+            fps=15,  # Lower FPS for better exposure
+        )
         
         self.scanning = True
         print("EAN-13 Scanner ready. Press 'Q' to quit.")
 
     def stop(self):
-        """Release camera resources."""
-        if self.cap and self.cap.isOpened():
+        """Hand the camera back to the session; it closes after its idle timeout."""
+        if self.cap is not None:
             self.cap.release()
+            self.cap = None
         cv2.destroyAllWindows()
         self.scanning = False
 
@@ -59,18 +72,43 @@ class EAN13Scanner:
         
         return sharpened
 
+    @staticmethod
+    def _valid(barcode):
+        """Reject misreads whose EAN-13 check digit does not match."""
+        return ean13_valid(barcode.data.decode('utf-8', 'replace'))
+
     def find_ean13(self, frame):
         """Detect EAN-13 barcodes in a frame."""
+        # Cheap pass: decode only the localised candidate crops
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        barcodes = decode_regions(gray, symbols=[ZBarSymbol.EAN13], accept=self._valid)
+        if barcodes:
+            return barcodes[0].data.decode('utf-8')
+
         processed = self.preprocess_frame(frame)
-        barcodes = decode(processed, symbols=[ZBarSymbol.EAN13])
+        barcodes = [b for b in zbar_decode(processed, [ZBarSymbol.EAN13], source="EAN13Scanner") if self._valid(b)]
         
         if barcodes:
             return barcodes[0].data.decode('utf-8')
         return None
 
+    @staticmethod
+    def roi_bounds(frame):
+        """Center region where barcodes are typically placed: (x0, y0, x1, y1)."""
+        h, w = frame.shape[:2]
+        return int(w*0.2), int(h*0.3), int(w*0.8), int(h*0.7)
+
+    def _decode(self, frame):
+        x0, y0, x1, y1 = self.roi_bounds(frame)
+        with metrics.timer("frame_decode_seconds", decoder="EAN13Scanner"):
+            return self.find_ean13(frame[y0:y1, x0:x1])
+
     def scan(self, timeout=10):
         """
         Scan for EAN-13 barcode with timeout.
+
+        Frames are grabbed on a capture thread and decoded by a worker pool
+        while this thread only draws the preview.
         
         Args:
             timeout (int): Maximum scanning time in seconds
@@ -80,42 +118,35 @@ class EAN13Scanner:
         """
         self.start()
         start_time = time.time()
+        # Only sharp, steady, well-exposed frames reach preprocess_frame and zbar
+        self.gate = FrameGate()
+        pipeline = FramePipeline(self.cap.frame_reader(), self._decode, workers=self.workers, gate=self.gate).start()
         
-        while self.scanning and (time.time() - start_time) < timeout:
-            ret, frame = self.cap.read()
-            if not ret:
-                continue
-                
-            # Focus on center region where barcodes are typically placed
-            h, w = frame.shape[:2]
-            roi = frame[int(h*0.3):int(h*0.7), int(w*0.2):int(w*0.8)]
-            
-            # Detect EAN-13
-            barcode = self.find_ean13(roi)
-            
-            # Visual feedback
-            cv2.rectangle(frame, 
-                         (int(w*0.2), int(h*0.3)),
-                         (int(w*0.8), int(h*0.7)),
-                         (0, 255, 0), 2)
-            
-            if barcode:
-                cv2.putText(frame, f"EAN-13: {barcode}", 
-                           (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 
-                           1, (0, 255, 0), 2)
-                self.last_barcode = barcode
-                self.stop()
-                return barcode
-            else:
+        try:
+            while self.scanning and (time.time() - start_time) < timeout:
+                result = pipeline.wait_for_result(timeout=0.03)
+                if result:
+                    self.last_barcode = result.data
+                    return result.data
+
+                frame = pipeline.buffer.latest
+                if frame is None:
+                    continue
+                frame = frame.copy()
+
+                # Visual feedback
+                x0, y0, x1, y1 = self.roi_bounds(frame)
+                cv2.rectangle(frame, (x0, y0), (x1, y1), (0, 255, 0), 2)
                 cv2.putText(frame, "Scanning for EAN-13...", 
                            (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 
                            1, (0, 0, 255), 2)
-            
-            cv2.imshow("EAN-13 Scanner", frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
                 
-        self.stop()
+                cv2.imshow("EAN-13 Scanner", frame)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+        finally:
+            pipeline.stop()
+            self.stop()
         return self.last_barcode
 
 # Example Usage
@@ -129,12 +160,14 @@ if __name__ == "__main__":
         if barcode:
             print(f"Success! Scanned EAN-13: {barcode}")
             # Validate EAN-13 check digit
-            if len(barcode) == 13 and barcode.isdigit():
-                print("Valid EAN-13 format")
+            if ean13_valid(barcode):
+                print("Valid EAN-13 check digit")
             else:
                 print("Warning: Doesn't match EAN-13 format")
         else:
             print("No EAN-13 barcode detected")
+        if scanner.gate is not None:
+            print(f"Frame gate: {scanner.gate.stats()}")
             
     except Exception as e:
         print(f"Error: {e}")
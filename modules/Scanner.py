@@ -1,93 +1,369 @@
 import cv2
 import numpy as np
-from pyzbar.pyzbar import decode, ZBarSymbol
 from PIL import Image
 import io
 import logging
+import re
+import time
+from collections import namedtuple
+from functools import partial
+from modules import metrics
+from modules.localize import decode_regions, zbar_decode
+from modules.frame_pipeline import FramePipeline
+from modules.frame_quality import FrameGate
+from modules.camera_session import acquire_camera
+from modules.decode_cache import decode_cache
+from modules.symbology import get_profile, symbol_valid
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def decode_barcode_from_bytes(image_bytes):
+DECODE_SYMBOLS = list(get_profile("any").symbols)
+
+# Longest side (px) the cheap first stage aims for; phone photos are
+# shrunk by the JPEG decoder itself via IMREAD_REDUCED_GRAYSCALE_*.
+REDUCED_TARGET_SIDE = 1280
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
+
+# Stages run in this order until one of them yields a barcode.
+DEFAULT_STAGES = ("reduced_gray", "localized", "full_gray", "threshold", "rotated")
+
+DecodeResult = namedtuple("DecodeResult", ["data", "stage", "timings"])
+
+# One distinct symbol found in an image. polygon is in full-image pixels,
+# quality is zbar's best score and passes counts how many passes saw it.
+Symbol = namedtuple("Symbol", ["data", "type", "polygon", "quality", "passes", "is_header"])
+
+# How a header label is told apart from item labels: a matching pattern
+# wins, otherwise the first symbol in a symbology of the "header" profile
+# (see _header_symbologies).
+HEADER_PATTERN = None
+
+
+class _DecodeContext:
+    """Lazily decoded views of one image, shared between stages."""
+
+    def __init__(self, image_bytes):
+        self.image_bytes = image_bytes
+        self.buffer = np.frombuffer(image_bytes, np.uint8)
+        self._gray = None
+        self._thresh = None
+
+    def image_size(self):
+        """Read (width, height) from the image header without decoding pixels."""
+        try:
+            return Image.open(io.BytesIO(self.image_bytes)).size
+        except Exception:
+            return None
+
+    def reduced(self):
+        """Return (image, factor) decoded at reduced size, or (None, 1) if not worth it."""
+        size = self.image_size()
+        if size is None:
+            return None, 1
+        longest = max(size)
+        for factor, flag in _REDUCED_FLAGS:
+            if longest // factor >= REDUCED_TARGET_SIDE:
+                return cv2.imdecode(self.buffer, flag), factor
+        # Already small: the full-resolution stage is just as cheap.
+        return None, 1
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            self._gray = cv2.imdecode(self.buffer, cv2.IMREAD_GRAYSCALE)
+            if self._gray is None:
+                raise ValueError("Image bytes could not be decoded")
+        return self._gray
+
+    @property
+    def thresh(self):
+        if self._thresh is None:
+            self._thresh = cv2.adaptiveThreshold(
+                self.gray, 255,
+                cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                cv2.THRESH_BINARY, 11, 2
+            )
+        return self._thresh
+
+
+def _is_valid(decoded):
+    """Check-digit / GS1 validation; a failed read lets the next pass retry."""
+    valid = symbol_valid(decoded.type, decoded.data.decode('utf-8', 'replace'))
+    if not valid:
+        metrics.inc("decode_rejected", symbology=decoded.type)
+        logger.warning(f"Rejected {decoded.type} read {decoded.data!r}: failed validation")
+    return valid
+
+
+def _decode_first(images, symbols):
+    for img_to_decode in images:
+        decoded = [d for d in zbar_decode(img_to_decode, symbols, source="Scanner") if _is_valid(d)]
+        if decoded:
+            return decoded
+    return []
+
+
+def _stage_reduced_gray(ctx, symbols):
+    reduced, _ = ctx.reduced()
+    return _decode_first([reduced], symbols) if reduced is not None else []
+
+
+def _stage_localized(ctx, symbols):
+    return decode_regions(ctx.gray, symbols=symbols, accept=_is_valid)
+
+
+def _stage_full_gray(ctx, symbols):
+    return _decode_first([ctx.gray], symbols)
+
+
+def _stage_threshold(ctx, symbols):
+    return _decode_first([ctx.thresh], symbols)
+
+
+# Same sharpening the EAN-13 camera scanner applies after thresholding
+_SHARPEN_KERNEL = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]])
+
+
+def _stage_sharpened(ctx, symbols):
+    return _decode_first([cv2.filter2D(ctx.thresh, -1, _SHARPEN_KERNEL)], symbols)
+
+
+def _rotate(image, angle):
+    h, w = image.shape[:2]
+    matrix = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    cos, sin = abs(matrix[0, 0]), abs(matrix[0, 1])
+    new_w, new_h = int(h * sin + w * cos), int(h * cos + w * sin)
+    matrix[0, 2] += new_w / 2 - w / 2
+    matrix[1, 2] += new_h / 2 - h / 2
+    return cv2.warpAffine(image, matrix, (new_w, new_h), borderValue=255)
+
+
+def _stage_rotated(ctx, symbols):
+    # zbar already scans both axes, so only diagonal labels need help.
+    return _decode_first((_rotate(ctx.gray, angle) for angle in (45, -45)), symbols)
+
+
+DECODE_STAGES = {
+    "reduced_gray": _stage_reduced_gray,
+    "localized": _stage_localized,
+    "full_gray": _stage_full_gray,
+    "threshold": _stage_threshold,
+    "sharpened": _stage_sharpened,
+    "rotated": _stage_rotated,
+}
+
+
+def decode_barcode_staged(image_bytes, stages=DEFAULT_STAGES, symbols=DECODE_SYMBOLS):
     """
-    Enhanced barcode decoder that handles mobile camera inputs better
+    Run the decode stages in order and stop at the first hit.
+
+    Returns a DecodeResult with the barcode text (or None), the name of
+    the stage that succeeded and the seconds spent in every stage tried.
     """
+    ctx = _DecodeContext(image_bytes)
+    timings = {}
+    for name in stages:
+        started = time.perf_counter()
+        try:
+            decoded = DECODE_STAGES[name](ctx, symbols)
+            if decoded:
+                return DecodeResult(decoded[0].data.decode('utf-8'), name, timings)
+        finally:
+            timings[name] = time.perf_counter() - started
+            metrics.observe("decode_stage_seconds", timings[name], stage=name)
+    return DecodeResult(None, None, timings)
+
+
+def _bbox(polygon):
+    xs = [p.x for p in polygon]
+    ys = [p.y for p in polygon]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _same_place(a, b):
+    ax0, ay0, ax1, ay1 = _bbox(a)
+    bx0, by0, bx1, by1 = _bbox(b)
+    ix = max(0, min(ax1, bx1) - max(ax0, bx0))
+    iy = max(0, min(ay1, by1) - max(ay0, by0))
+    smaller = min((ax1 - ax0) * (ay1 - ay0), (bx1 - bx0) * (by1 - by0)) or 1
+    return ix * iy > 0.3 * smaller
+
+
+def _scaled(decoded, factor):
+    if factor == 1:
+        return decoded
+    return decoded._replace(polygon=[p._replace(x=p.x * factor, y=p.y * factor) for p in decoded.polygon])
+
+
+def _header_symbologies():
+    """
+    Symbology names of the header profile, those that items never use
+    first, so a QR header beats a CODE128 item label in the same photo.
+    """
+    header = get_profile("header").symbologies
+    item = set(get_profile("item").symbologies)
+    return tuple(sorted(header, key=lambda name: name in item))
+
+
+def _mark_header(symbols):
+    header = None
+    if HEADER_PATTERN:
+        header = next((s for s in symbols if re.fullmatch(HEADER_PATTERN, s.data)), None)
+    for symbology in _header_symbologies():
+        if header is None:
+            header = next((s for s in symbols if s.type == symbology), None)
+    return [s._replace(is_header=s is header) for s in symbols]
+
+
+def _decode_all(image_bytes, symbols=DECODE_SYMBOLS):
+    """
+    Return every distinct symbol in an image.
+
+    The reduced, localised, grayscale and thresholded passes all run; a
+    code seen by several passes at the same place is reported once, while
+    two labels with the same text at different places stay separate.
+    Exactly one symbol is flagged is_header when any looks like a header.
+    """
+    ctx = _DecodeContext(image_bytes)
+    reduced, factor = ctx.reduced()
+    passes = []
+    if reduced is not None:
+        passes.append([_scaled(d, factor) for d in zbar_decode(reduced, symbols, source="multi")])
+    passes.append(decode_regions(ctx.gray, symbols=symbols, first_only=False))
+    passes.append(zbar_decode(ctx.gray, symbols, source="multi"))
+    passes.append(zbar_decode(ctx.thresh, symbols, source="multi"))
+
+    found = []
+    for decoded_pass in passes:
+        for d in decoded_pass:
+            if not _is_valid(d):
+                continue
+            data = d.data.decode('utf-8')
+            quality = getattr(d, "quality", 1)
+            for i, known in enumerate(found):
+                if known.data == data and known.type == d.type and _same_place(known.polygon, d.polygon):
+                    found[i] = known._replace(quality=max(known.quality, quality), passes=known.passes + 1)
+                    break
+            else:
+                found.append(Symbol(data, d.type, list(d.polygon), quality, 1, False))
+    return _mark_header(found)
+
+
+def decode_all_from_bytes(image_bytes):
+    """Cached multi-symbol decode; see _decode_all."""
+    settings = ("Scanner.decode_all", tuple(DECODE_SYMBOLS), HEADER_PATTERN, _header_symbologies())
+    return decode_cache.get_or_compute(settings, image_bytes, _decode_all)
+
+
+def split_header(symbols):
+    """Split decode_all_from_bytes output into (header text or None, [item texts])."""
+    header = next((s.data for s in symbols if s.is_header), None)
+    return header, [s.data for s in symbols if not s.is_header]
+
+
+def _decode_barcode(image_bytes, profile=None):
     try:
-        # Convert bytes to numpy array
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        
-        # Decode with OpenCV
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        # Convert to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # Apply adaptive thresholding for mobile camera inputs
-        thresh = cv2.adaptiveThreshold(
-            gray, 255,
-            cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY, 11, 2
+        result = decode_barcode_staged(image_bytes, symbols=list(get_profile(profile).symbols))
+        logger.info(
+            "Decode stage=%s timings=%s",
+            result.stage,
+            {name: round(seconds * 1000, 1) for name, seconds in result.timings.items()},
         )
-        
-        # Try decoding with different approaches
-        for img_to_decode in [gray, thresh, img]:
-            decoded = decode(
-                img_to_decode,
-                symbols=[ZBarSymbol.EAN13, ZBarSymbol.CODE128, ZBarSymbol.QRCODE],
-                # These parameters help with mobile camera images:
-                try_harder=True,
-                try_rotate=True
-            )
-            if decoded:
-                return decoded[0].data.decode('utf-8')
-        
-        return None
-        
+        return result.data
+
     except Exception as e:
         logger.error(f"Decoding failed: {str(e)}")
         return None
 
+
+def _settings(profile):
+    return ("Scanner.decode", DEFAULT_STAGES, get_profile(profile))
+
+
+def decode_barcode_from_bytes(image_bytes, profile=None):
+    """
+    Enhanced barcode decoder that handles mobile camera inputs better
+
+    profile ("header", "item" or None for any) limits the symbologies zbar
+    looks for. Results are cached by image content, so Streamlit reruns
+    that resend the same photo cost no decode.
+    """
+    return decode_cache.get_or_compute(_settings(profile), image_bytes, partial(_decode_barcode, profile=profile))
+
+
+def decode_many(images, workers=None, timeout=None, kind="process", profile=None):
+    """
+    Decode many image byte strings in parallel.
+
+    Yields BatchResult(index, value, error, elapsed) in completion order,
+    where value is the barcode text or None and index is the position of
+    the image in `images`.
+    """
+    return decode_cache.run_batch(
+        _settings(profile), partial(_decode_barcode, profile=profile), images,
+        workers=workers, timeout=timeout, kind=kind
+    )
+
+
+def decode_frame(frame, profile="item"):
+    """Decode one BGR camera frame: localised crops first, then the whole frame."""
+    symbols = list(get_profile(profile).symbols)
+    with metrics.timer("frame_decode_seconds", decoder="Scanner"):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        decoded = decode_regions(gray, symbols=symbols, accept=_is_valid) or _decode_first([gray], symbols)
+    if decoded:
+        return decoded[0].data.decode('utf-8')
+    return None
+
+
 class RealTimeBarcodeScanner:
-    def __init__(self):
-        self.cap = cv2.VideoCapture(0)
-        if not self.cap.isOpened():
-            raise RuntimeError("Could not open video device")
+    def __init__(self, camera_index=0, workers=2, profile="item"):
+        # Shared, already-warm device; released back to the session on release()
+        self.camera = acquire_camera(camera_index)
+        self.workers = workers
+        self.profile = profile
+        self.gate = None
 
-    def scan(self, max_attempts=5):
+    def scan(self, max_attempts=5, timeout=5.0):
         """
         Enhanced real-time scanning with mobile compatibility
+
+        Frames are grabbed continuously on a capture thread; blurred,
+        washed-out or moving frames are dropped by a FrameGate and the
+        rest decoded by a small worker pool. Gives up after max_attempts
+        decoded frames or timeout seconds, after one last try on the
+        sharpest frames seen. self.gate keeps the rejection counts.
         """
-        for _ in range(max_attempts):
-            ret, frame = self.cap.read()
-            if not ret:
-                continue
-                
-            # Convert frame to RGB (better for mobile)
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            
-            # Try multiple decoding strategies
-            for img_to_decode in [frame, rgb_frame]:
-                decoded = decode(
-                    img_to_decode,
-                    symbols=[ZBarSymbol.EAN13, ZBarSymbol.CODE128],
-                    try_harder=True
-                )
-                if decoded:
-                    return decoded[0].data.decode('utf-8')
-                
-            # Optional: Add small delay between attempts
-            cv2.waitKey(300)
-            
+        read_frame = self.camera.frame_reader()
+        decode_fn = partial(decode_frame, profile=self.profile)
+        self.gate = FrameGate()
+        with FramePipeline(read_frame, decode_fn, workers=self.workers, gate=self.gate) as pipeline:
+            result = pipeline.wait_for_result(timeout=timeout, max_frames=max_attempts)
+        if result:
+            return result.data
+        for frame in self.gate.best_frames():
+            data = decode_fn(frame)
+            if data:
+                return data
         return None
 
     def release(self):
-        if self.cap.isOpened():
-            self.cap.release()
-        cv2.destroyAllWindows()
+        if self.camera is not None:
+            self.camera.release()
+            self.camera = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
 
 # Mobile-specific helper function
-def decode_mobile_image(image_bytes):
+def decode_mobile_image(image_bytes, profile="item"):
     """
     Specialized decoder for mobile camera photos
     """
@@ -102,12 +378,9 @@ def decode_mobile_image(image_bytes):
         img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
         img_array = cv2.resize(img_array, (0,0), fx=1.5, fy=1.5)  # Upscale
         
-        return decode(
-            img_array,
-            symbols=[ZBarSymbol.EAN13, ZBarSymbol.CODE128],
-            try_harder=True,
-            try_rotate=True
-        )[0].data.decode('utf-8') if decode(img_array) else None
+        with metrics.timer("image_decode_seconds", decoder="mobile"):
+            decoded = _decode_first([img_array], list(get_profile(profile).symbols))
+        return decoded[0].data.decode('utf-8') if decoded else None
         
     except Exception as e:
         logger.error(f"Mobile decoding failed: {str(e)}")
@@ -0,0 +1,90 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+BatchResult = namedtuple("BatchResult", ["index", "value", "error", "elapsed"])
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(kind="process", workers=None):
+    """
+    Return a long-lived executor shared by every batch in this process.
+
+    Starting worker processes is the expensive part of a pool, so one pool
+    per (kind, workers) is kept for the life of the server.
+    """
+    workers = workers or os.cpu_count() or 1
+    key = (kind, workers)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            if kind == "process":
+                pool = ProcessPoolExecutor(max_workers=workers, mp_context=_process_context())
+            else:
+                pool = ThreadPoolExecutor(max_workers=workers)
+            _pools[key] = pool
+        return pool
+
+
+def _process_context():
+    """
+    Start workers from a clean server process, never by forking this one:
+    pools are created lazily inside threaded servers (Streamlit), and a
+    fork taken while another thread holds a lock leaves the child stuck.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _timed_call(func, item):
+    started = time.perf_counter()
+    return func(item), time.perf_counter() - started
+
+
+def run_batch(func, items, workers=None, timeout=None, kind="process"):
+    """
+    Apply func to every item on a pool, yielding BatchResult in completion order.
+
+    timeout is per item and counts from when the item starts running; an
+    item over its budget is reported with error "timeout" and abandoned.
+    For process pools func must be a picklable top-level function.
+    """
+    pool = get_pool(kind, workers)
+    futures = {pool.submit(_timed_call, func, item): index for index, item in enumerate(items)}
+    started = {}
+    pending = set(futures)
+
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=0.05 if timeout else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = futures[future]
+                try:
+                    value, elapsed = future.result()
+                    yield BatchResult(index, value, None, elapsed)
+                except Exception as e:
+                    logger.error(f"Batch item {index} failed: {str(e)}")
+                    yield BatchResult(index, None, str(e), None)
+
+            if timeout is None:
+                continue
+            now = time.monotonic()
+            for future in list(pending):
+                if future.running():
+                    started.setdefault(future, now)
+                if future in started and now - started[future] > timeout:
+                    future.cancel()
+                    pending.discard(future)
+                    yield BatchResult(futures[future], None, "timeout", now - started[future])
+    finally:
+        # Consumer stopped early: drop whatever has not started yet
+        for future in pending:
+            future.cancel()
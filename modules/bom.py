@@ -0,0 +1,203 @@
+import glob
+import logging
+import os
+import pickle
+import re
+import threading
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Engineering BOM exports shipped with the app.
+BOM_GLOB = os.path.join(PROJECT_ROOT, "EBOM_*.xls")
+# Bump when the pickled index layout changes so old caches are rebuilt.
+INDEX_FORMAT = 1
+
+# One part in a BOM. total_qty is the quantity needed for one top-level
+# unit (quantities multiplied down the tree and summed over every place
+# the part is used); unit is the top-level deliverable it belongs to.
+BomPart = namedtuple("BomPart", ["part_number", "revision", "description", "level", "total_qty", "unit"])
+
+BomCheck = namedtuple("BomCheck", ["missing", "extra", "over"])
+
+
+class BomIndex:
+    """Part number -> BomPart lookup for one engineering BOM."""
+
+    def __init__(self, root_part, parts):
+        self.root_part = root_part
+        self.parts = parts
+        # Deliverables shipped under a header: the direct children of the root
+        self.units = [p.part_number for p in parts.values() if p.level == 2]
+
+    def __contains__(self, part_number):
+        return normalise_part(part_number) in self.parts
+
+    def get(self, part_number):
+        return self.parts.get(normalise_part(part_number))
+
+    def describe(self, part_number):
+        part = self.get(part_number)
+        return part.description if part else None
+
+    def check(self, scanned):
+        """
+        Compare scanned {part number: quantity} with the BOM.
+
+        missing: units with no scan of themselves or any part inside them
+        extra: scanned part numbers not in the BOM
+        over: {part: (scanned, expected)} where more were scanned than needed
+        """
+        counts = {}
+        for part_number, qty in scanned.items():
+            key = normalise_part(part_number)
+            counts[key] = counts.get(key, 0) + qty
+        extra = sorted(p for p in counts if p not in self.parts)
+        over = {
+            p: (qty, self.parts[p].total_qty)
+            for p, qty in counts.items()
+            if p in self.parts and qty > self.parts[p].total_qty
+        }
+        covered = {self.parts[p].unit for p in counts if p in self.parts}
+        missing = [u for u in self.units if u not in covered]
+        return BomCheck(missing, extra, over)
+
+
+def normalise_part(code):
+    """Scanned codes may carry a revision ("1001003462, 1") or padding."""
+    return str(code).split(",")[0].strip()
+
+
+def _parse_qty(value):
+    try:
+        qty = float(value)
+    except (TypeError, ValueError):
+        return 1
+    if qty != qty:  # NaN: the root row has no quantity
+        return 1
+    return int(qty) if qty.is_integer() else qty
+
+
+def parse_bom(path):
+    """Read an EBOM .xls export into a BomIndex."""
+    import pandas as pd
+
+    sheet = pd.read_excel(path, header=None, dtype=object)
+    header_row = next(i for i, row in sheet.iterrows() if "Name, Rev" in row.values)
+    columns = list(sheet.iloc[header_row])
+    name_col = columns.index("Name, Rev")
+    desc_col = columns.index("Description")
+    qty_col = columns.index("Qty")
+
+    parts = {}
+    # multiplier[level] = units of the current level-`level` part per root
+    multiplier = {}
+    root = current_unit = None
+    for row in sheet.iloc[header_row + 1:].itertuples(index=False):
+        try:
+            level = int(row[0])
+        except (TypeError, ValueError):
+            continue
+        part_number, _, revision = str(row[name_col]).partition(",")
+        part_number = part_number.strip()
+        qty = _parse_qty(row[qty_col])
+        total = qty * multiplier.get(level - 1, 1)
+        multiplier[level] = total
+        if level == 1:
+            root = part_number
+        if level == 2:
+            current_unit = part_number
+        unit = part_number if level <= 2 else current_unit
+
+        known = parts.get(part_number)
+        if known:
+            parts[part_number] = known._replace(total_qty=known.total_qty + total, level=min(known.level, level))
+        else:
+            description = row[desc_col] if isinstance(row[desc_col], str) else ""
+            parts[part_number] = BomPart(part_number, revision.strip(), description, level, total, unit)
+    return BomIndex(root, parts)
+
+
+def _cache_path(path):
+    return path + ".idx.pickle"
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return INDEX_FORMAT, stat.st_mtime_ns, stat.st_size
+
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def load_bom(path):
+    """
+    Return the BomIndex for an .xls file.
+
+    The parsed index is pickled next to the file and reused until the
+    file's mtime or size changes; within a process it is parsed at most once.
+    """
+    signature = _signature(path)
+    with _lock:
+        cached = _loaded.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+        index = None
+        try:
+            with open(_cache_path(path), "rb") as f:
+                stored_signature, index = pickle.load(f)
+            if stored_signature != signature:
+                index = None
+        except (OSError, pickle.PickleError, EOFError, ValueError):
+            index = None
+
+        if index is None:
+            index = parse_bom(path)
+            try:
+                with open(_cache_path(path), "wb") as f:
+                    pickle.dump((signature, index), f, protocol=pickle.HIGHEST_PROTOCOL)
+            except OSError as e:
+                logger.warning(f"Could not write BOM cache: {str(e)}")
+            logger.info(f"Indexed BOM {os.path.basename(path)}: {len(index.parts)} parts")
+
+        _loaded[path] = (signature, index)
+        return index
+
+
+def bom_for_header(header_id, pattern=BOM_GLOB):
+    """Find the BOM whose top-level part number appears in the header code, if any."""
+    if not header_id:
+        return None
+    for path in sorted(glob.glob(pattern)):
+        match = re.search(r"EBOM_(\d+)", os.path.basename(path))
+        if match and match.group(1) in str(header_id):
+            return load_bom(path)
+    return None
+
+
+def describe_part(part_number, pattern=BOM_GLOB):
+    """BOM description for a scanned part from any known BOM, or None."""
+    for path in sorted(glob.glob(pattern)):
+        description = load_bom(path).describe(part_number)
+        if description:
+            return description
+    return None
+
+
+def check_items(header_id, items):
+    """
+    Validate scanned item dicts against the header's BOM.
+
+    Returns (BomIndex, BomCheck), or (None, None) when no BOM matches.
+    """
+    index = bom_for_header(header_id)
+    if index is None:
+        return None, None
+    scanned = {}
+    for item in items:
+        if item:
+            scanned[item["item_id"]] = scanned.get(item["item_id"], 0) + item.get("quantity", 1)
+    return index, index.check(scanned)
@@ -0,0 +1,200 @@
+import atexit
+import cv2
+import logging
+import threading
+import time
+
+from modules import metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds a camera stays open after its last user released it.
+DEFAULT_IDLE_TIMEOUT = 30.0
+
+_PROPERTIES = {
+    "width": cv2.CAP_PROP_FRAME_WIDTH,
+    "height": cv2.CAP_PROP_FRAME_HEIGHT,
+    "fps": cv2.CAP_PROP_FPS,
+    "autofocus": cv2.CAP_PROP_AUTOFOCUS,
+}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class CameraSession:
+    """
+    A shared, reference-counted handle on one capture device.
+
+    The device is opened on first acquire and a grab thread keeps reading
+    so exposure stays settled and read() always returns a fresh frame.
+    When the last user releases it, the device is closed after
+    idle_timeout seconds unless someone acquires it again.
+    """
+
+    def __init__(self, camera_index=0, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.camera_index = camera_index
+        self.idle_timeout = idle_timeout
+        self.settings = {}
+        self.cap = None
+        self.refcount = 0
+        self._lock = threading.RLock()
+        self._frame_ready = threading.Condition(self._lock)
+        self._frame = None
+        self._seq = 0
+        self._grabber = None
+        self._idle_timer = None
+        self._running = False
+        self._stop_grab = None
+
+    def _open(self):
+        with metrics.timer("camera_open_seconds"):
+            cap = cv2.VideoCapture(self.camera_index)
+        if not cap.isOpened():
+            raise RuntimeError("Could not open video device")
+        self.cap = cap
+        self._apply(self.settings)
+        self._running = True
+        self._stop_grab = threading.Event()
+        self._grabber = threading.Thread(
+            target=self._grab_loop, args=(cap, self._stop_grab),
+            name=f"camera-{self.camera_index}", daemon=True
+        )
+        self._grabber.start()
+        logger.info(f"Opened camera {self.camera_index}")
+
+    def _apply(self, settings):
+        for name, value in settings.items():
+            self.cap.set(_PROPERTIES[name], value)
+
+    def configure(self, **settings):
+        """Apply capture settings (width, height, fps, autofocus) that differ from the current ones."""
+        with self._lock:
+            changed = {k: v for k, v in settings.items() if v is not None and self.settings.get(k) != v}
+            self.settings.update(changed)
+            if self.cap is not None and changed:
+                self._apply(changed)
+
+    def _grab_loop(self, cap, stop):
+        while not stop.is_set():
+            with metrics.timer("camera_read_seconds"):
+                ret, frame = cap.read()
+            if not ret:
+                metrics.inc("camera_read_failures")
+                time.sleep(0.01)
+                continue
+            with self._frame_ready:
+                self._frame = frame
+                self._seq += 1
+                self._frame_ready.notify_all()
+
+    def acquire(self):
+        with self._lock:
+            if self._idle_timer is not None:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+            if self.cap is None:
+                self._open()
+            self.refcount += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self.refcount = max(0, self.refcount - 1)
+            if self.refcount == 0 and self.cap is not None and self._idle_timer is None:
+                self._idle_timer = threading.Timer(self.idle_timeout, self._close_if_idle)
+                self._idle_timer.daemon = True
+                self._idle_timer.start()
+
+    def _close_if_idle(self):
+        with self._lock:
+            self._idle_timer = None
+            if self.refcount > 0:
+                return
+            handles = self._detach()
+        self._shutdown(*handles)
+
+    def _detach(self):
+        """Mark the session closed; caller must hold the lock."""
+        self._running = False
+        if self._stop_grab is not None:
+            self._stop_grab.set()
+        handles = (self.cap, self._grabber)
+        self.cap, self._grabber, self._frame = None, None, None
+        self._frame_ready.notify_all()
+        return handles
+
+    def _shutdown(self, cap, grabber):
+        # Called without the lock so the grab thread can finish its last frame
+        if grabber is not None:
+            grabber.join(timeout=1.0)
+        if cap is not None:
+            cap.release()
+            logger.info(f"Closed camera {self.camera_index}")
+
+    def close(self):
+        """Stop grabbing and release the device immediately."""
+        with self._lock:
+            if self._idle_timer is not None:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+            handles = self._detach()
+        self._shutdown(*handles)
+
+    def read(self, timeout=1.0, after_seq=None):
+        """
+        Return (seq, frame) for the next frame newer than after_seq,
+        or (seq, None) if none arrives within timeout.
+        """
+        with self._frame_ready:
+            target = self._seq if after_seq is None else after_seq
+            self._frame_ready.wait_for(lambda: self._seq > target or not self._running, timeout)
+            if self._seq > target:
+                return self._seq, self._frame
+            return self._seq, None
+
+    def frame_reader(self, timeout=1.0):
+        """Return a read_frame() callable yielding each new frame once, for FramePipeline."""
+        last = [None]
+
+        def read_frame():
+            seq, frame = self.read(timeout=timeout, after_seq=last[0])
+            last[0] = seq
+            return frame
+
+        return read_frame
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def acquire_camera(camera_index=0, idle_timeout=None, **settings):
+    """
+    Get the process-wide session for a camera, opening it if needed.
+
+    Usage:
+        with acquire_camera(0, width=1280, height=720) as camera:
+            read_frame = camera.frame_reader()
+    """
+    with _sessions_lock:
+        session = _sessions.get(camera_index)
+        if session is None:
+            session = _sessions[camera_index] = CameraSession(camera_index)
+    if idle_timeout is not None:
+        session.idle_timeout = idle_timeout
+    session.configure(**settings)
+    return session.acquire()
+
+
+def close_all_cameras():
+    """Release every open device, e.g. at interpreter shutdown."""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+    for session in sessions:
+        session.close()
+
+
+atexit.register(close_all_cameras)
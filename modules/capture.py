@@ -0,0 +1,85 @@
+import base64
+import os
+from collections import namedtuple
+
+import streamlit.components.v1 as components
+
+from modules import metrics
+
+# Longest side, in pixels, photos are resized to in the browser before
+# upload. 1600 px keeps EAN-13 bars several pixels wide on a half-frame label.
+CAPTURE_MAX_SIDE = int(os.environ.get("CAPTURE_MAX_SIDE", "1600"))
+# JPEG quality (0-1) for the re-encoded upload.
+CAPTURE_QUALITY = float(os.environ.get("CAPTURE_QUALITY", "0.85"))
+# Aim box as fractions (x0, y0, x1, y1); the same centre region
+# EAN13Scanner.roi_bounds decodes from live frames.
+GUIDE_BOX = (0.2, 0.3, 0.8, 0.7)
+
+_FRONTEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "capture_frontend")
+_component = components.declare_component("compact_capture", path=_FRONTEND)
+
+
+class CapturedImage(namedtuple("CapturedImage", ["file_id", "name", "data", "width", "height", "original_bytes"])):
+    """A compressed capture; getvalue() and file_id match Streamlit's UploadedFile."""
+
+    __slots__ = ()
+
+    def getvalue(self):
+        return self.data
+
+
+# Capture ids already counted in the byte metrics; the component returns
+# the same value on every rerun until a new photo is taken.
+_counted = set()
+
+
+def _count(file_id, sent, original):
+    if file_id in _counted:
+        return
+    if len(_counted) > 10000:
+        _counted.clear()
+    _counted.add(file_id)
+    metrics.inc("capture_bytes_uploaded", sent)
+    if original:
+        metrics.inc("capture_bytes_original", original)
+
+
+def _images(value):
+    if not value:
+        return []
+    images = []
+    for f in value.get("files", []):
+        data = base64.b64decode(f["data"])
+        _count(f["id"], len(data), f.get("original_bytes"))
+        images.append(CapturedImage(f["id"], f["name"], data, f["width"], f["height"], f.get("original_bytes")))
+    return images
+
+
+def compact_camera_input(label, key=None, max_side=CAPTURE_MAX_SIDE, quality=CAPTURE_QUALITY, crop_to_guide=False):
+    """
+    Camera capture resized and JPEG-compressed on the device.
+
+    With crop_to_guide only the aim box shown over the preview is sent.
+    Returns a CapturedImage, or None until a photo has been taken.
+    """
+    value = _component(
+        label=label, mode="camera", multiple=False, max_side=max_side, quality=quality,
+        guide=GUIDE_BOX if crop_to_guide else None, key=key or label, default=None,
+    )
+    images = _images(value)
+    return images[0] if images else None
+
+
+def compact_file_uploader(label, key=None, multiple=False, max_side=CAPTURE_MAX_SIDE, quality=CAPTURE_QUALITY):
+    """
+    Photo upload compressed in the browser; a list of CapturedImage when
+    multiple, else one CapturedImage or None.
+    """
+    value = _component(
+        label=label, mode="upload", multiple=multiple, max_side=max_side, quality=quality,
+        guide=None, key=key or label, default=None,
+    )
+    images = _images(value)
+    if multiple:
+        return images
+    return images[0] if images else None
@@ -0,0 +1,210 @@
+import hashlib
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from database.image_store import ImageStore
+from modules import metrics
+
+# Photo bytes one session keeps in memory before the least recently used
+# ones are written to a temp directory. A few compressed captures fit.
+SESSION_IMAGE_BUDGET = int(os.environ.get("SESSION_IMAGE_BUDGET", str(8 * 1024 * 1024)))
+
+
+class CartItem:
+    """
+    One scanned item: fixed slots instead of a dict, and the photo as a
+    content hash into the cart's images rather than the bytes themselves.
+
+    item["item_id"] and item.get("quantity", 1) still work, so the BOM
+    check reads it like the item dicts it was written for.
+    """
+
+    __slots__ = ("item_id", "description", "quantity", "image_key")
+
+    def __init__(self, item_id, description="", quantity=1, image_key=None):
+        self.item_id = item_id
+        self.description = description
+        self.quantity = quantity
+        self.image_key = image_key
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def __repr__(self):
+        return f"CartItem({self.item_id!r}, quantity={self.quantity})"
+
+
+# Every open cart in this process, for the metrics page
+_carts = weakref.WeakSet()
+_carts_lock = threading.Lock()
+_ids = itertools.count(1)
+
+
+class Cart:
+    """
+    One packing session's header, items and photos.
+
+    Photos are kept once per distinct content. Past `budget` bytes the
+    least recently used are spilled to a per-cart temp directory and read
+    back on demand; close() (after the slip is saved) drops everything
+    and removes that directory, which is also removed if the session is
+    simply abandoned and the cart garbage collected.
+    """
+
+    def __init__(self, budget=SESSION_IMAGE_BUDGET):
+        self.id = next(_ids)
+        self.created = time.time()
+        self.budget = budget
+        self.header = None
+        self.items = []
+        # Photo used for items without their own, e.g. one shot of the crate
+        self.default_image = None
+        self._images = OrderedDict()
+        self._memory = 0
+        self._spilled = {}
+        self._spill_store = None
+        self._cleanup = None
+        self._lock = threading.Lock()
+        with _carts_lock:
+            _carts.add(self)
+
+    def put_image(self, image_bytes):
+        """Keep a photo and return its key; the same photo twice is kept once."""
+        key = hashlib.sha256(image_bytes).hexdigest()
+        self._prune()
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+            elif key not in self._spilled:
+                self._images[key] = image_bytes
+                self._memory += len(image_bytes)
+                self._spill_over_budget()
+        return key
+
+    def get_image(self, key):
+        """Photo bytes for a key, from memory or the spill directory."""
+        if key is None:
+            return None
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return self._images[key]
+            store = self._spill_store
+        return store.get(key) if store and key in self._spilled else None
+
+    def set_image(self, item, image_bytes):
+        item.image_key = self.put_image(image_bytes)
+
+    def remove(self, index):
+        """Drop the item at index, and its photo if nothing else uses it."""
+        self.items.pop(index)
+        self._prune()
+
+    def _spill_over_budget(self):
+        while self._memory > self.budget and self._images:
+            key, image_bytes = self._images.popitem(last=False)
+            if self._spill_store is None:
+                spill_dir = tempfile.mkdtemp(prefix="packing-cart-")
+                self._spill_store = ImageStore(spill_dir)
+                self._cleanup = weakref.finalize(self, shutil.rmtree, spill_dir, True)
+            self._spill_store.put(image_bytes)
+            self._spilled[key] = len(image_bytes)
+            self._memory -= len(image_bytes)
+            metrics.inc("session_images_spilled")
+            metrics.inc("session_image_bytes_spilled", len(image_bytes))
+
+    def _prune(self):
+        """Forget photos no item (or the default) refers to any more."""
+        used = {item.image_key for item in self.items if item is not None}
+        used.add(self.default_image)
+        with self._lock:
+            for key in [k for k in self._images if k not in used]:
+                self._memory -= len(self._images.pop(key))
+            for key in [k for k in self._spilled if k not in used]:
+                del self._spilled[key]
+                try:
+                    os.remove(self._spill_store.path(key))
+                except FileNotFoundError:
+                    pass
+
+    def slip_items(self, store):
+        """
+        Item dicts for save_packing_slip. Each distinct photo is read once
+        and put into `store` (the database's image store) as it goes, so
+        the slip never holds all photo bytes at the same time.
+        """
+        stored = {}
+        rows = []
+        for item in self.items:
+            if item is None:
+                continue
+            key = item.image_key or self.default_image
+            if key and key not in stored:
+                stored[key] = store.put(self.get_image(key))
+            rows.append({
+                "item_id": item.item_id,
+                "description": item.description,
+                "quantity": item.quantity,
+                "image_hash": stored.get(key),
+            })
+        return rows
+
+    def close(self):
+        """Release everything once the slip is saved."""
+        with self._lock:
+            self.header = None
+            self.items = []
+            self.default_image = None
+            self._images.clear()
+            self._memory = 0
+            self._spilled.clear()
+            self._spill_store = None
+        if self._cleanup:
+            self._cleanup()
+        with _carts_lock:
+            _carts.discard(self)
+
+    def stats(self):
+        with self._lock:
+            items = [item for item in self.items if item is not None]
+            record_bytes = sys.getsizeof(self.items) + sum(
+                sys.getsizeof(item) + sys.getsizeof(item.item_id) + sys.getsizeof(item.description)
+                for item in items
+            )
+            return {
+                "cart": self.id,
+                "age_s": round(time.time() - self.created),
+                "items": len(items),
+                "record_bytes": record_bytes,
+                "images_in_memory": len(self._images),
+                "image_bytes_in_memory": self._memory,
+                "images_spilled": len(self._spilled),
+                "image_bytes_spilled": sum(self._spilled.values()),
+            }
+
+
+def session_memory():
+    """stats() of every open cart, largest in-memory footprint first."""
+    with _carts_lock:
+        carts = list(_carts)
+    rows = [cart.stats() for cart in carts]
+    rows.sort(key=lambda r: r["image_bytes_in_memory"] + r["record_bytes"], reverse=True)
+    return rows
+
+
+metrics.registry.gauge("session_carts", lambda: len(_carts))
+metrics.registry.gauge("session_image_bytes", lambda: sum(r["image_bytes_in_memory"] for r in session_memory()))
+metrics.registry.gauge("session_image_bytes_spilled", lambda: sum(r["image_bytes_spilled"] for r in session_memory()))
@@ -0,0 +1,112 @@
+import hashlib
+import pickle
+import threading
+from collections import OrderedDict
+
+from modules import metrics
+from modules.batch import BatchResult, run_batch
+
+# Default memory budget for cached decode results, in bytes.
+DEFAULT_BUDGET = 16 * 1024 * 1024
+
+
+def image_key(image_bytes, settings):
+    """Cache key: a 128-bit BLAKE2 digest of the image plus the decoder settings."""
+    return settings, hashlib.blake2b(image_bytes, digest_size=16).digest()
+
+
+class DecodeCache:
+    """
+    Thread-safe LRU of decode results bounded by an approximate byte budget.
+
+    Entry size is the pickled size of the result plus the key, which is
+    close enough for strings and small lists of symbols.
+    """
+
+    def __init__(self, budget=DEFAULT_BUDGET):
+        self.budget = budget
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        size = len(pickle.dumps(value)) + len(repr(key))
+        if size > self.budget:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.budget:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def get_or_compute(self, settings, image_bytes, func):
+        """Return func(image_bytes), computing it only on a cache miss."""
+        key = image_key(image_bytes, settings)
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = func(image_bytes)
+            self.put(key, value)
+        return value
+
+    def run_batch(self, settings, func, images, **batch_options):
+        """
+        Like batch.run_batch, but cached results are yielded first and only
+        the misses are sent to the pool.
+        """
+        missing = object()
+        keys = [image_key(image_bytes, settings) for image_bytes in images]
+        todo = []
+        for index, key in enumerate(keys):
+            value = self.get(key, missing)
+            if value is missing:
+                todo.append(index)
+            else:
+                yield BatchResult(index, value, None, 0.0)
+
+        for result in run_batch(func, [images[i] for i in todo], **batch_options):
+            index = todo[result.index]
+            if result.error is None:
+                self.put(keys[index], result.value)
+            yield result._replace(index=index)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "budget": self.budget,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Module state lives as long as the server process, so every Streamlit
+# session shares this one cache.
+decode_cache = DecodeCache()
+metrics.registry.gauge("decode_cache_hit_rate", lambda: decode_cache.stats()["hit_rate"])
+metrics.registry.gauge("decode_cache_bytes", lambda: decode_cache.stats()["bytes"])
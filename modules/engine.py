@@ -0,0 +1,240 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from functools import partial
+
+from modules import metrics
+from modules.decode_cache import decode_cache
+from modules.symbology import get_profile
+
+logger = logging.getLogger(__name__)
+
+# Per-deployment choice of decoder, e.g. SCANNER_STRATEGY=adaptive. An app
+# can pick its own default with set_default_strategy; the variable wins.
+DEFAULT_STRATEGY = os.environ.get("SCANNER_STRATEGY", "opencv")
+# Optional file where the adaptive strategy keeps its stage statistics.
+ADAPTIVE_STATS_PATH = os.environ.get("SCANNER_ADAPTIVE_STATS")
+# Fraction of adaptive decodes that try a random order, so a stage that
+# has fallen to the back can still prove itself.
+EXPLORE_RATE = 0.05
+
+
+def _symbols(profile):
+    return list(get_profile(profile).symbols)
+
+
+def _scanner():
+    """modules.Scanner, imported on first decode since it loads OpenCV and NumPy."""
+    from modules import Scanner
+    return Scanner
+
+
+def _staged(stages=None):
+    def run(image_bytes, profile):
+        scanner = _scanner()
+        return scanner.decode_barcode_staged(
+            image_bytes, stages=stages or scanner.DEFAULT_STAGES, symbols=_symbols(profile)
+        )
+    return run
+
+
+def _pil(image_bytes, profile):
+    from modules import scanner1
+
+    started = time.perf_counter()
+    data = scanner1._decode_barcode(image_bytes, profile)
+    return _scanner().DecodeResult(data, "pil" if data else None, {"pil": time.perf_counter() - started})
+
+
+class StageStats:
+    """
+    Hit rate and latency per preprocessing stage, learned from real decodes.
+
+    Stages are ordered by expected hits per second spent: a stage that
+    often succeeds quickly goes first, one that rarely helps goes last.
+    Untried stages rank first until they have some history.
+    """
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self._lock = threading.Lock()
+        self.attempts = {name: 0 for name in self.stages}
+        self.hits = {name: 0 for name in self.stages}
+        self.seconds = {name: 0.0 for name in self.stages}
+
+    def record(self, result):
+        with self._lock:
+            for name, seconds in result.timings.items():
+                if name in self.attempts:
+                    self.attempts[name] += 1
+                    self.seconds[name] += seconds
+            if result.stage in self.hits:
+                self.hits[result.stage] += 1
+
+    def _score(self, name):
+        attempts = self.attempts[name]
+        if attempts < 5:
+            return float("inf")
+        hit_rate = (self.hits[name] + 1) / (attempts + 2)
+        return hit_rate / (self.seconds[name] / attempts + 1e-4)
+
+    def order(self):
+        with self._lock:
+            if random.random() < EXPLORE_RATE:
+                return tuple(random.sample(self.stages, len(self.stages)))
+            return tuple(sorted(self.stages, key=self._score, reverse=True))
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: {
+                    "attempts": self.attempts[name],
+                    "hits": self.hits[name],
+                    "mean_ms": 1000 * self.seconds[name] / self.attempts[name] if self.attempts[name] else None,
+                }
+                for name in self.stages
+            }
+
+    def save(self, path):
+        with self._lock:
+            data = {"attempts": self.attempts, "hits": self.hits, "seconds": self.seconds}
+        with open(path, "w") as f:
+            json.dump(data, f)
+
+    def load(self, path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            for key in ("attempts", "hits", "seconds"):
+                getattr(self, key).update({k: v for k, v in data.get(key, {}).items() if k in self.attempts})
+
+
+class ScannerEngine:
+    """
+    One entry point over every decoder in the project.
+
+    strategy names a decoder from STRATEGIES:
+      opencv   - the staged OpenCV/zbar decoder from Scanner.py
+      pil      - the plain PIL decoder from scanner1.py
+      ean13    - localised crops then threshold + sharpen, as the camera scanner does
+      adaptive - the staged decoder with its stage order learned from results
+    """
+
+    STRATEGIES = {
+        "opencv": _staged(),
+        "pil": _pil,
+        "ean13": _staged(("localized", "sharpened")),
+    }
+
+    def __init__(self, strategy=DEFAULT_STRATEGY, stats_path=ADAPTIVE_STATS_PATH):
+        if strategy != "adaptive" and strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown scanner strategy: {strategy}")
+        self.strategy = strategy
+        self.stats = StageStats(_scanner().DECODE_STAGES)
+        self.stats_path = stats_path
+        if stats_path:
+            self.stats.load(stats_path)
+        self._decodes = 0
+
+    def _run(self, image_bytes, profile):
+        if self.strategy == "adaptive":
+            result = _scanner().decode_barcode_staged(image_bytes, stages=self.stats.order(), symbols=_symbols(profile))
+        else:
+            result = self.STRATEGIES[self.strategy](image_bytes, profile)
+        self.stats.record(result)
+        self._decodes += 1
+        if self.stats_path and self._decodes % 50 == 0:
+            self.stats.save(self.stats_path)
+        return result
+
+    def decode_result(self, image_bytes, profile=None):
+        """Uncached decode returning the full DecodeResult (stage and timings)."""
+        try:
+            with metrics.timer("image_decode_seconds", decoder=self.strategy):
+                return self._run(image_bytes, profile)
+        except Exception as e:
+            logger.error(f"Decoding failed: {str(e)}")
+            return _scanner().DecodeResult(None, None, {})
+
+    def _decode(self, image_bytes, profile=None):
+        return self.decode_result(image_bytes, profile).data
+
+    def _settings(self, profile):
+        # The adaptive order changes speed, not which codes are found
+        return ("engine", self.strategy, get_profile(profile))
+
+    def decode(self, image_bytes, profile=None):
+        """Barcode text or None, cached by image content."""
+        return decode_cache.get_or_compute(
+            self._settings(profile), image_bytes, lambda b: self._decode(b, profile)
+        )
+
+    def decode_many(self, images, workers=None, timeout=None, kind="process", profile=None):
+        """
+        Parallel decode yielding BatchResult in completion order.
+
+        Process workers each run their own engine with this strategy, so
+        adaptive statistics they gather stay in the worker; kind="thread"
+        decodes on this engine and its statistics see every result.
+        """
+        if kind == "process":
+            func = partial(_decode_with, self.strategy, profile)
+        else:
+            func = lambda b: self._decode(b, profile)
+        return decode_cache.run_batch(
+            self._settings(profile), func, images, workers=workers, timeout=timeout, kind=kind
+        )
+
+
+# Engines of a process pool worker, by strategy
+_worker_engines = {}
+
+
+def _decode_with(strategy, profile, image_bytes):
+    """Top-level so process pools can pickle it."""
+    engine = _worker_engines.get(strategy)
+    if engine is None:
+        engine = _worker_engines[strategy] = ScannerEngine(strategy, stats_path=None)
+    return engine._decode(image_bytes, profile)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def set_default_strategy(strategy):
+    """
+    Decode with `strategy` in this process unless SCANNER_STRATEGY is set,
+    e.g. main1.py keeps its original PIL decoder. Call before decoding.
+    """
+    global DEFAULT_STRATEGY, _engine
+    if "SCANNER_STRATEGY" in os.environ:
+        return
+    with _engine_lock:
+        DEFAULT_STRATEGY = strategy
+        if _engine is not None and _engine.strategy != strategy:
+            _engine = None
+
+
+def get_engine():
+    """The process-wide engine configured for this deployment."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = ScannerEngine(DEFAULT_STRATEGY)
+            logger.info(f"Scanner strategy: {_engine.strategy}")
+        return _engine
+
+
+def decode_barcode_from_bytes(image_bytes, profile=None):
+    return get_engine().decode(image_bytes, profile)
+
+
+def decode_many(images, workers=None, timeout=None, kind="process", profile=None):
+    return get_engine().decode_many(images, workers=workers, timeout=timeout, kind=kind, profile=profile)
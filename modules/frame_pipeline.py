@@ -0,0 +1,158 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+
+logger = logging.getLogger(__name__)
+
+ScanResult = namedtuple("ScanResult", ["data", "frame_seq", "latency"])
+
+
+class LatestFrameBuffer:
+    """
+    Bounded ring of the most recent camera frames.
+
+    The capture thread never blocks: when the ring is full the oldest frame
+    is overwritten. Consumers always take the newest frame available.
+    """
+
+    def __init__(self, size=2):
+        self._frames = deque(maxlen=size)
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._closed = False
+        self.latest = None
+        self.dropped = 0
+
+    def put(self, frame):
+        with self._cond:
+            if len(self._frames) == self._frames.maxlen:
+                self.dropped += 1
+            self._seq += 1
+            self._frames.append((self._seq, frame, time.perf_counter()))
+            self.latest = frame
+            self._cond.notify()
+
+    def show(self, frame):
+        """Update the preview frame without queueing it for decoding."""
+        self.latest = frame
+
+    def take(self, timeout=None):
+        """Pop the newest (seq, frame, captured_at), or None on timeout/close."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._frames or self._closed, timeout)
+            if not self._frames:
+                return None
+            return self._frames.pop()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class FramePipeline:
+    """
+    One capture thread feeding a pool of decode workers.
+
+    read_frame() returns a frame or None; decode_frame(frame) returns the
+    barcode text or None. pyzbar and OpenCV release the GIL, so several
+    workers decode in parallel. Hits are put on `results` and passed to
+    on_result if given. With a gate (see frame_quality.FrameGate), frames
+    it rejects are only shown, never decoded.
+    """
+
+    def __init__(self, read_frame, decode_frame, workers=2, buffer_size=None, on_result=None, gate=None):
+        self.read_frame = read_frame
+        self.decode_frame = decode_frame
+        self.gate = gate
+        self.workers = workers
+        self.on_result = on_result
+        self.buffer = LatestFrameBuffer(buffer_size or workers)
+        self.results = queue.Queue()
+        self.frames_decoded = 0
+        self._count_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._capture_loop, name="frame-capture", daemon=True)]
+        self._threads += [
+            threading.Thread(target=self._decode_loop, name=f"frame-decode-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.buffer.close()
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        self._threads = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _capture_loop(self):
+        while not self._stop.is_set():
+            try:
+                frame = self.read_frame()
+            except Exception as e:
+                logger.error(f"Frame capture failed: {str(e)}")
+                break
+            if frame is None:
+                continue
+            if self.gate is None or self.gate.accept(frame):
+                self.buffer.put(frame)
+            else:
+                self.buffer.show(frame)
+
+    def _decode_loop(self):
+        while not self._stop.is_set():
+            item = self.buffer.take(timeout=0.1)
+            if item is None:
+                continue
+            seq, frame, captured_at = item
+            try:
+                data = self.decode_frame(frame)
+            except Exception as e:
+                logger.error(f"Frame decoding failed: {str(e)}")
+                data = None
+            if data and not self._stop.is_set():
+                result = ScanResult(data, seq, time.perf_counter() - captured_at)
+                self.results.put(result)
+                if self.on_result:
+                    self.on_result(result)
+            # Counted after the result is queued so wait_for_result never
+            # gives up on a frame whose hit is still in flight
+            with self._count_lock:
+                self.frames_decoded += 1
+
+    def wait_for_result(self, timeout=None, max_frames=None):
+        """
+        Block until a barcode is decoded.
+
+        Gives up after `timeout` seconds or once `max_frames` frames have
+        been decoded without a hit, and returns None in that case.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                return self.results.get(timeout=0.05)
+            except queue.Empty:
+                pass
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            if max_frames is not None and self.frames_decoded >= max_frames:
+                # A worker may have queued a hit just before the count check
+                try:
+                    return self.results.get_nowait()
+                except queue.Empty:
+                    return None
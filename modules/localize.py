@@ -0,0 +1,137 @@
+import cv2
+import numpy as np
+from collections import namedtuple
+from pyzbar.pyzbar import decode
+
+from modules import metrics
+
+# A candidate barcode area in full-image pixel coordinates.
+Region = namedtuple("Region", ["x", "y", "w", "h", "score"])
+
+# Localisation runs on a copy no wider than this; boxes are scaled back up.
+WORK_WIDTH = 640
+# Fraction of the box size added on every side so quiet zones survive the crop.
+REGION_PADDING = 0.15
+# Boxes smaller than this fraction of the work image are ignored as noise.
+MIN_REGION_AREA = 0.002
+
+
+def _gradient_maps(gray):
+    """
+    Return response maps for horizontal 1D, vertical 1D and 2D codes.
+
+    1D bars have a strong gradient across the bars and almost none along
+    them; 2D modules have strong gradients in both directions.
+    """
+    gx = cv2.convertScaleAbs(cv2.Sobel(gray, cv2.CV_16S, 1, 0, ksize=-1))
+    gy = cv2.convertScaleAbs(cv2.Sobel(gray, cv2.CV_16S, 0, 1, ksize=-1))
+    return (
+        (cv2.subtract(gx, gy), (21, 7)),
+        (cv2.subtract(gy, gx), (7, 21)),
+        (cv2.min(gx, gy), (11, 11)),
+    )
+
+
+def _regions_from_map(response, kernel_size):
+    blurred = cv2.blur(response, (9, 9))
+    _, mask = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, kernel_size)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    mask = cv2.erode(mask, None, iterations=4)
+    mask = cv2.dilate(mask, None, iterations=4)
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = MIN_REGION_AREA * response.shape[0] * response.shape[1]
+    regions = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if w * h < min_area:
+            continue
+        fill = cv2.contourArea(contour) / float(w * h)
+        strength = float(response[y:y + h, x:x + w].mean()) / 255.0
+        regions.append(Region(x, y, w, h, strength * fill * np.sqrt(w * h)))
+    return regions
+
+
+def zbar_decode(image, symbols=None, source="other"):
+    """pyzbar.decode with its time recorded per call in zbar_pass_seconds."""
+    with metrics.timer("zbar_pass_seconds", source=source):
+        return decode(image, symbols=symbols)
+
+
+def _overlaps(a, b):
+    ix = max(0, min(a.x + a.w, b.x + b.w) - max(a.x, b.x))
+    iy = max(0, min(a.y + a.h, b.y + b.h) - max(a.y, b.y))
+    inter = ix * iy
+    return inter > 0.5 * min(a.w * a.h, b.w * b.h)
+
+
+def find_barcode_regions(gray, max_regions=4):
+    """
+    Find likely barcode areas in a grayscale image.
+
+    Returns up to max_regions padded boxes in the coordinates of `gray`,
+    highest confidence first.
+    """
+    h, w = gray.shape[:2]
+    scale = min(1.0, WORK_WIDTH / float(w))
+    small = cv2.resize(gray, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else gray
+
+    candidates = []
+    for response, kernel_size in _gradient_maps(small):
+        candidates.extend(_regions_from_map(response, kernel_size))
+    candidates.sort(key=lambda r: r.score, reverse=True)
+
+    regions = []
+    for candidate in candidates:
+        if any(_overlaps(candidate, kept) for kept in regions):
+            continue
+        regions.append(candidate)
+        if len(regions) == max_regions:
+            break
+
+    scaled = []
+    for r in regions:
+        pad_x, pad_y = r.w * REGION_PADDING, r.h * REGION_PADDING
+        x0 = max(0, int((r.x - pad_x) / scale))
+        y0 = max(0, int((r.y - pad_y) / scale))
+        x1 = min(w, int((r.x + r.w + pad_x) / scale))
+        y1 = min(h, int((r.y + r.h + pad_y) / scale))
+        scaled.append(Region(x0, y0, x1 - x0, y1 - y0, r.score))
+    return scaled
+
+
+def crop_regions(image, regions):
+    """Yield (region, crop) pairs; crops are views, not copies."""
+    for region in regions:
+        yield region, image[region.y:region.y + region.h, region.x:region.x + region.w]
+
+
+def _shift(decoded, dx, dy):
+    """Move a pyzbar result from crop coordinates back to image coordinates."""
+    rect = decoded.rect._replace(left=decoded.rect.left + dx, top=decoded.rect.top + dy)
+    polygon = [p._replace(x=p.x + dx, y=p.y + dy) for p in decoded.polygon]
+    return decoded._replace(rect=rect, polygon=polygon)
+
+
+def decode_regions(gray, symbols=None, max_regions=4, first_only=True, accept=None):
+    """
+    Localise barcodes in `gray` and run zbar on the candidate crops only.
+
+    This is the shared entry point for photo uploads and camera frames.
+    Returns pyzbar results in full-image coordinates; with first_only the
+    search stops at the first crop that decodes. Results for which
+    accept(decoded) is false are dropped, so a misread does not end the search.
+    """
+    found = []
+    with metrics.timer("localize_seconds"):
+        regions = find_barcode_regions(gray, max_regions=max_regions)
+    for region, crop in crop_regions(gray, regions):
+        decoded = zbar_decode(crop, symbols=symbols, source="localized")
+        if accept is not None:
+            decoded = [d for d in decoded if accept(d)]
+        if decoded:
+            found.extend(_shift(d, region.x, region.y) for d in decoded)
+            if first_only:
+                break
+    return found
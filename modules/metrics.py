@@ -0,0 +1,262 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+# PACKING_METRICS=0 turns every timer and counter into a no-op.
+ENABLED = os.environ.get("PACKING_METRICS", "1") != "0"
+# PACKING_METRICS_ADMIN=1 shows the on/off toggle and reset button on the
+# shared Metrics page; without it the page is read-only for packers.
+ADMIN_CONTROLS = os.environ.get("PACKING_METRICS_ADMIN", "0") == "1"
+# Set PACKING_METRICS_PORT to serve /metrics in Prometheus text format.
+METRICS_PORT = os.environ.get("PACKING_METRICS_PORT")
+
+# Upper bounds in seconds; from sub-millisecond zbar passes to slow exports.
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+class Histogram:
+    """Prometheus-style cumulative-bucket histogram; observe() is O(log buckets)."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of its bucket, capped at the largest value seen."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Registry:
+    """Named counters and histograms, each with optional labels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def gauge(self, name, func):
+        """Register func() to be sampled whenever metrics are read."""
+        with self._lock:
+            self.gauges[name] = func
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def snapshot(self):
+        """Rows for display: one dict per counter, gauge and histogram series."""
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {key: (h.count, h.sum, h.max, h.quantile(0.5), h.quantile(0.95), h.quantile(0.99))
+                          for key, h in self.histograms.items()}
+            gauges = dict(self.gauges)
+        rows = []
+        for (name, labels), value in sorted(counters.items()):
+            rows.append({"metric": name, "labels": dict(labels), "count": value})
+        for name, func in sorted(gauges.items()):
+            rows.append({"metric": name, "labels": {}, "value": _sample(func)})
+        for (name, labels), (count, total, peak, p50, p95, p99) in sorted(histograms.items()):
+            rows.append({
+                "metric": name,
+                "labels": dict(labels),
+                "count": count,
+                "mean_ms": round(1000 * total / count, 2) if count else None,
+                "p50_ms": p50 and 1000 * p50,
+                "p95_ms": p95 and 1000 * p95,
+                "p99_ms": p99 and 1000 * p99,
+                "max_ms": round(1000 * peak, 2),
+            })
+        return rows
+
+    def render_prometheus(self):
+        """The text exposition format served at /metrics."""
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {key: (h.buckets, list(h.counts), h.count, h.sum) for key, h in self.histograms.items()}
+            gauges = dict(self.gauges)
+        lines = []
+        for (name, labels), value in sorted(counters.items()):
+            lines.append(f"{name}_total{_labels(labels)} {value}")
+        for name, func in sorted(gauges.items()):
+            value = _sample(func)
+            if isinstance(value, (int, float)):
+                lines.append(f"{name} {value}")
+        for (name, labels), (buckets, counts, count, total) in sorted(histograms.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', repr(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def _sample(func):
+    try:
+        return func()
+    except Exception as e:
+        return f"error: {e}"
+
+
+registry = Registry()
+
+
+def set_enabled(flag):
+    """Switch instrumentation on or off at runtime, e.g. from the admin page."""
+    global ENABLED
+    ENABLED = bool(flag)
+
+
+def inc(name, value=1, **labels):
+    if ENABLED:
+        registry.inc(name, value, **labels)
+
+
+def observe(name, seconds, **labels):
+    if ENABLED:
+        registry.observe(name, seconds, **labels)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "started")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        registry.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+def timer(name, **labels):
+    """
+    Context manager recording the block's duration in histogram `name`.
+
+    With instrumentation disabled this returns a shared no-op object, so
+    hot paths pay one flag check.
+    """
+    if not ENABLED:
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+
+def timed(name, **labels):
+    """Decorator form of timer()."""
+    def wrap(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            with _Timer(name, labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return wrap
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def serve(port=None, host="0.0.0.0"):
+    """
+    Serve registry.render_prometheus() at http://host:port/metrics from a
+    daemon thread. Only the first call starts a server.
+    """
+    global _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, int(port or METRICS_PORT or 9108)), Handler)
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+            logger.info(f"Serving metrics on port {_server.server_address[1]}")
+        return _server
+
+
+def serve_from_env():
+    """Start the /metrics endpoint if PACKING_METRICS_PORT is set."""
+    if METRICS_PORT:
+        try:
+            serve()
+        except OSError as e:
+            # Another worker process already owns the port
+            logger.warning(f"Metrics endpoint not started: {str(e)}")
@@ -1,16 +1,41 @@
 from pyzbar.pyzbar import decode
-from PIL import Image
+from PIL import Image, ImageOps
+from functools import partial
 import io
 import logging
+from modules import metrics
+from modules.decode_cache import decode_cache
+from modules.symbology import get_profile, symbol_valid
 
-def decode_barcode_from_bytes(image_bytes):
-    """Decode barcode from image bytes with error handling"""
+def _settings(profile):
+    return ("scanner1.decode", get_profile(profile))
+
+def _valid(decoded):
+    return symbol_valid(decoded.type, decoded.data.decode('utf-8', 'replace'))
+
+def _decode_barcode(image_bytes, profile=None):
     try:
         img = Image.open(io.BytesIO(image_bytes))
-        decoded_objects = decode(img)
-        if decoded_objects:
-            return decoded_objects[0].data.decode('utf-8')
+        symbols = list(get_profile(profile).symbols)
+        # Contrast-stretched grayscale is only tried when the plain pass
+        # finds nothing that passes check-digit validation
+        for variant in (lambda: img, lambda: ImageOps.autocontrast(img.convert('L'))):
+            with metrics.timer("zbar_pass_seconds", source="scanner1"):
+                decoded_objects = [d for d in decode(variant(), symbols=symbols) if _valid(d)]
+            if decoded_objects:
+                return decoded_objects[0].data.decode('utf-8')
         return None
     except Exception as e:
         logging.error(f"Barcode decoding failed: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+def decode_barcode_from_bytes(image_bytes, profile=None):
+    """Decode barcode from image bytes with error handling, cached by image content"""
+    return decode_cache.get_or_compute(_settings(profile), image_bytes, partial(_decode_barcode, profile=profile))
+
+def decode_many(images, workers=None, timeout=None, kind="process", profile=None):
+    """Decode many images in parallel, yielding BatchResult in completion order"""
+    return decode_cache.run_batch(
+        _settings(profile), partial(_decode_barcode, profile=profile), images,
+        workers=workers, timeout=timeout, kind=kind
+    )
@@ -0,0 +1,126 @@
+import os
+from collections import namedtuple
+
+GS1_SEPARATOR = "\x1d"
+
+# Fixed-length GS1 Application Identifiers we expect on labels: AI -> data length.
+# Anything else is treated as variable length, ended by the group separator.
+GS1_FIXED_LENGTH = {
+    "00": 18,  # SSCC
+    "01": 14,  # GTIN
+    "02": 14,  # GTIN of contained items
+    "11": 6,   # production date
+    "15": 6,   # best before
+    "17": 6,   # expiry
+    "20": 2,   # variant
+}
+# AIs whose data ends in a GS1 mod-10 check digit.
+GS1_CHECKED = ("00", "01", "02")
+
+
+def mod10_valid(digits):
+    """GS1 mod-10 check used by EAN-13, GTIN-14 and SSCC."""
+    if not digits.isdigit() or len(digits) < 2:
+        return False
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(reversed(digits[:-1]), start=1))
+    return (10 - total % 10) % 10 == int(digits[-1])
+
+
+def ean13_valid(code):
+    return len(code) == 13 and mod10_valid(code)
+
+
+def parse_gs1(code):
+    """
+    Split GS1-128 data into {AI: value}; returns None if it does not parse.
+
+    Accepts data with or without the "]C1" symbology identifier.
+    """
+    if code.startswith("]C1"):
+        code = code[3:]
+    fields = {}
+    pos = 0
+    while pos < len(code):
+        ai = code[pos:pos + 2]
+        if not ai.isdigit():
+            return None
+        pos += 2
+        length = GS1_FIXED_LENGTH.get(ai)
+        if length is not None:
+            value = code[pos:pos + length]
+            if len(value) != length:
+                return None
+            pos += length
+            if code[pos:pos + 1] == GS1_SEPARATOR:
+                pos += 1
+        else:
+            end = code.find(GS1_SEPARATOR, pos)
+            end = len(code) if end == -1 else end
+            value = code[pos:end]
+            pos = end + 1
+        fields[ai] = value
+    return fields
+
+
+def looks_like_gs1(code):
+    return code.startswith("]C1") or GS1_SEPARATOR in code
+
+
+def code128_valid(code):
+    """
+    zbar already verifies the Code 128 checksum; for GS1-128 data the
+    element strings must also parse and their check digits must match.
+    """
+    if not code:
+        return False
+    if not looks_like_gs1(code):
+        return True
+    fields = parse_gs1(code)
+    if not fields:
+        return False
+    return all(mod10_valid(fields[ai]) for ai in GS1_CHECKED if ai in fields)
+
+
+VALIDATORS = {
+    "EAN13": ean13_valid,
+    "CODE128": code128_valid,
+}
+
+
+def symbol_valid(symbol_type, data):
+    """Check a decoded symbol's content; symbologies without a validator pass."""
+    validator = VALIDATORS.get(symbol_type)
+    return validator(data) if validator else bool(data)
+
+
+# Which symbologies a scan slot enables. Fewer symbologies means fewer
+# zbar decoders run per pass and fewer chances for a misread.
+class DecodeProfile(namedtuple("DecodeProfile", ["name", "symbologies"])):
+    """
+    symbologies are zbar names; symbols resolves them to ZBarSymbol, so
+    pyzbar (and libzbar) load with the first decode, not on import.
+    """
+
+    __slots__ = ()
+
+    @property
+    def symbols(self):
+        from pyzbar.pyzbar import ZBarSymbol
+        return tuple(ZBarSymbol[name] for name in self.symbologies)
+
+
+# Header labels come as CODE128, QR or EAN-13 depending on the customer;
+# e.g. HEADER_SYMBOLOGIES=CODE128,QRCODE narrows the slot for a site.
+HEADER_SYMBOLOGIES = os.environ.get("HEADER_SYMBOLOGIES", "CODE128,QRCODE,EAN13")
+
+PROFILES = {
+    "header": DecodeProfile(
+        "header", tuple(name.strip().upper() for name in HEADER_SYMBOLOGIES.split(",") if name.strip())
+    ),
+    "item": DecodeProfile("item", ("EAN13", "CODE128")),
+    "any": DecodeProfile("any", ("EAN13", "CODE128", "QRCODE")),
+}
+
+
+def get_profile(name):
+    return PROFILES[name or "any"]
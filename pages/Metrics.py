@@ -0,0 +1,64 @@
+import streamlit as st
+from modules import metrics
+from modules.decode_cache import decode_cache
+from modules.cart import SESSION_IMAGE_BUDGET, session_memory
+
+st.set_page_config(page_title="Metrics", page_icon="📈")
+
+st.title("📈 Scanning Metrics")
+st.caption("In-memory timings for this server process since it started or was last reset.")
+
+# Both affect the whole server process, so only when an admin enabled them
+if metrics.ADMIN_CONTROLS:
+    enabled = st.toggle("Instrumentation enabled", value=metrics.ENABLED)
+    if enabled != metrics.ENABLED:
+        metrics.set_enabled(enabled)
+elif not metrics.ENABLED:
+    st.warning("Instrumentation is off for this server.")
+
+rows = metrics.registry.snapshot()
+timings = [r for r in rows if "p50_ms" in r]
+counters = [r for r in rows if "p50_ms" not in r]
+
+# ---------- Slowest first ----------
+st.header("Timings")
+if timings:
+    timings.sort(key=lambda r: (r["mean_ms"] or 0) * r["count"], reverse=True)
+    st.dataframe(
+        [{"metric": r["metric"], "labels": ", ".join(f"{k}={v}" for k, v in r["labels"].items()), **{
+            k: r[k] for k in ("count", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms")
+        }} for r in timings],
+        use_container_width=True,
+    )
+    st.caption("Sorted by total time spent. Percentiles are bucket upper bounds.")
+else:
+    st.info("Nothing recorded yet.")
+
+st.header("Counters")
+st.dataframe(
+    [{"metric": r["metric"], "labels": ", ".join(f"{k}={v}" for k, v in r["labels"].items()),
+      "value": r.get("count", r.get("value"))} for r in counters],
+    use_container_width=True,
+)
+
+st.header("Decode cache")
+st.json(decode_cache.stats())
+
+st.header("Session memory")
+sessions = session_memory()
+if sessions:
+    st.dataframe(sessions, use_container_width=True)
+    st.caption(
+        f"{len(sessions)} open carts, {sum(r['image_bytes_in_memory'] for r in sessions) / 1e6:.1f} MB of photos in memory, "
+        f"{sum(r['image_bytes_spilled'] for r in sessions) / 1e6:.1f} MB spilled to disk. "
+        f"Budget per session: {SESSION_IMAGE_BUDGET / 1e6:.1f} MB."
+    )
+else:
+    st.info("No open packing sessions.")
+
+with st.expander("Prometheus text"):
+    st.code(metrics.registry.render_prometheus(), language="text")
+
+if metrics.ADMIN_CONTROLS and st.button("Reset metrics"):
+    metrics.registry.reset()
+    st.rerun()
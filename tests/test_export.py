@@ -0,0 +1,47 @@
+import csv
+import io
+import os
+import zipfile
+
+from database.connection import get_pool
+from database.export import ExportFilter, export_parquet, export_zip
+
+
+def _pool(tmp_path):
+    """A db_manager-shaped database: one header saved on two days."""
+    pool = get_pool(str(tmp_path / "packing.db"))
+    with pool.transaction() as conn:
+        conn.execute(
+            "CREATE TABLE packing_slip (id INTEGER PRIMARY KEY AUTOINCREMENT, header_id TEXT, "
+            "customer_name TEXT, location TEXT, time_of_packing TEXT)"
+        )
+        conn.execute(
+            "CREATE TABLE packing_items (id INTEGER PRIMARY KEY AUTOINCREMENT, header_id TEXT, item_id TEXT, "
+            "description TEXT, quantity INTEGER, image BLOB, image_hash TEXT, slip_id INTEGER)"
+        )
+        for slip_id, day, item in ((1, "2026-02-01", "FIRST"), (2, "2026-02-03", "SECOND")):
+            conn.execute(
+                "INSERT INTO packing_slip (id, header_id, customer_name, location, time_of_packing) "
+                "VALUES (?, 'H1', 'Acme', 'Bawal', ?)", (slip_id, f"{day} 10:00:00")
+            )
+            conn.execute(
+                "INSERT INTO packing_items (header_id, item_id, description, quantity, slip_id) "
+                "VALUES ('H1', ?, '', 1, ?)", (item, slip_id)
+            )
+    return pool
+
+
+def test_date_filter_keeps_items_of_other_slips_under_the_header_out(tmp_path):
+    pool = _pool(tmp_path)
+    out = io.BytesIO()
+    export_zip(pool, out, ExportFilter(start="2026-02-03", end="2026-02-04"))
+    with zipfile.ZipFile(out) as zip_file:
+        items = list(csv.DictReader(io.TextIOWrapper(zip_file.open("packing_items.csv"), encoding="utf-8")))
+    assert [row["item_id"] for row in items] == ["SECOND"]
+
+
+def test_parquet_date_filter_writes_only_that_day(tmp_path):
+    pool = _pool(tmp_path)
+    root = tmp_path / "dataset"
+    export_parquet(pool, str(root), ExportFilter(start="2026-02-03", end="2026-02-04"))
+    assert os.listdir(root / "packing_items") == ["packing_date=2026-02-03"]